@@ -0,0 +1,169 @@
+import hashlib
+import json
+import sqlite3
+from array import array
+from helpers import *
+from xrefs import XrefIndex
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS analyses (
+    id INTEGER PRIMARY KEY,
+    rom_hash TEXT NOT NULL,
+    start_pc INTEGER NOT NULL,
+    start_bank INTEGER NOT NULL,
+    mode TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    UNIQUE (rom_hash, start_pc, start_bank, mode, version)
+);
+CREATE TABLE IF NOT EXISTS chunks (
+    analysis_id INTEGER NOT NULL REFERENCES analyses(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    addresses BLOB NOT NULL,
+    codes BLOB NOT NULL,
+    args BLOB NOT NULL,
+    lengths BLOB NOT NULL,
+    warnings TEXT,
+    infos TEXT,
+    end_warning TEXT,
+    PRIMARY KEY (analysis_id, position)
+);
+CREATE TABLE IF NOT EXISTS xrefs (
+    analysis_id INTEGER NOT NULL REFERENCES analyses(id) ON DELETE CASCADE,
+    kind TEXT NOT NULL,
+    targets BLOB NOT NULL,
+    sources BLOB NOT NULL,
+    PRIMARY KEY (analysis_id, kind)
+);
+CREATE TABLE IF NOT EXISTS states (
+    analysis_id INTEGER PRIMARY KEY REFERENCES analyses(id) ON DELETE CASCADE,
+    counts BLOB NOT NULL,
+    addresses BLOB NOT NULL,
+    banks BLOB NOT NULL,
+    stack_balances BLOB NOT NULL
+);
+'''
+
+
+def get_rom_hash(program):
+    return hashlib.sha256(program).hexdigest()
+
+
+def _dump_notes(notes):
+    return json.dumps(sorted(notes.items())) if notes else None
+
+
+def _load_notes(text):
+    return {index: note for index, note in json.loads(text)} if text else {}
+
+
+class AnalysisCache:
+    # chunk indexes of finished analyses, stored in sqlite database
+    def __init__(self, file_name, version):
+        self.version = version
+        self.db = sqlite3.connect(file_name)
+        self.db.execute('PRAGMA foreign_keys = ON')
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def _find(self, rom_hash, start_pc, start_bank, mode):
+        row = self.db.execute('SELECT id FROM analyses WHERE rom_hash = ? AND start_pc = ? AND start_bank = ? '
+                              'AND mode = ? AND version = ?',
+                              (rom_hash, start_pc, start_bank, mode, self.version)).fetchone()
+
+        return row[0] if row is not None else None
+
+    def load(self, rom_hash, start_pc, start_bank, mode):
+        # cached chunk index, None if analysis is not cached
+        analysis_id = self._find(rom_hash, start_pc, start_bank, mode)
+
+        if analysis_id is None:
+            return None
+
+        index = ChunkIndex()
+        rows = self.db.execute('SELECT addresses, codes, args, lengths, warnings, infos, end_warning FROM chunks '
+                               'WHERE analysis_id = ? ORDER BY position', (analysis_id,))
+
+        for addresses, codes, args, lengths, warnings, infos, end_warning in rows:
+            chunk = Chunk(end_warning)
+            chunk.addresses.frombytes(addresses)
+            chunk.codes.frombytes(codes)
+            chunk.args.frombytes(args)
+            chunk.lengths.frombytes(lengths)
+            chunk.warnings = _load_notes(warnings)
+            chunk.infos = _load_notes(infos)
+            index.insert(chunk)
+
+        return index
+
+    def load_xrefs(self, rom_hash, start_pc, start_bank, mode):
+        # cross references of cached analysis, None if analysis is not cached or was stored without them
+        analysis_id = self._find(rom_hash, start_pc, start_bank, mode)
+        rows = self.db.execute('SELECT kind, targets, sources FROM xrefs WHERE analysis_id = ?',
+                               (analysis_id,)).fetchall()
+
+        if not rows:
+            return None
+
+        xrefs = XrefIndex()
+
+        for kind, targets, sources in rows:
+            xrefs.targets[kind].frombytes(targets)
+            xrefs.sources[kind].frombytes(sources)
+
+        return xrefs
+
+    def load_states(self, rom_hash, start_pc, start_bank, mode):
+        # chunk start -> [(internal address, bank, stack balance)] of cached analysis, None if analysis is not
+        # cached or was stored without them
+        analysis_id = self._find(rom_hash, start_pc, start_bank, mode)
+        row = self.db.execute('SELECT counts, addresses, banks, stack_balances FROM states WHERE analysis_id = ?',
+                              (analysis_id,)).fetchone()
+
+        if row is None:
+            return None
+
+        counts, addresses, banks, stack_balances = array('I'), array('I'), array('H'), array('i')
+
+        for values, blob in zip((counts, addresses, banks, stack_balances), row):
+            values.frombytes(blob)
+
+        states = {}
+        states_iter = zip(addresses, banks, stack_balances)
+
+        for count in counts:
+            chunk_states = [next(states_iter) for _ in range(count)]
+            states[chunk_states[0][0]] = chunk_states
+
+        return states
+
+    def store(self, rom_hash, start_pc, start_bank, mode, index, xrefs=None, states=None):
+        with self.db:
+            analysis_id = self._find(rom_hash, start_pc, start_bank, mode)
+
+            if analysis_id is not None:
+                self.db.execute('DELETE FROM analyses WHERE id = ?', (analysis_id,))
+
+            analysis_id = self.db.execute('INSERT INTO analyses (rom_hash, start_pc, start_bank, mode, version) '
+                                          'VALUES (?, ?, ?, ?, ?)',
+                                          (rom_hash, start_pc, start_bank, mode, self.version)).lastrowid
+
+            self.db.executemany('INSERT INTO chunks VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                                ((analysis_id, position, chunk.addresses.tobytes(), chunk.codes.tobytes(),
+                                  chunk.args.tobytes(), chunk.lengths.tobytes(), _dump_notes(chunk.warnings),
+                                  _dump_notes(chunk.infos), chunk.end_warning)
+                                 for position, chunk in enumerate(index.values())))
+
+            if xrefs is not None:
+                xrefs.sort()
+                self.db.executemany('INSERT INTO xrefs VALUES (?, ?, ?, ?)',
+                                    ((analysis_id, kind, xrefs.targets[kind].tobytes(), xrefs.sources[kind].tobytes())
+                                     for kind in xrefs.targets))
+
+            if states is not None:
+                chunk_states = [states[start] for start in sorted(states)]
+                self.db.execute('INSERT INTO states VALUES (?, ?, ?, ?, ?)',
+                                (analysis_id, array('I', map(len, chunk_states)).tobytes(),
+                                 *(array(code, [state[field] for values in chunk_states for state in values]).tobytes()
+                                   for field, code in enumerate('IHi'))))
@@ -0,0 +1,145 @@
+import argparse
+import glob
+import os
+import sqlite3
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from helpers import map_rom
+from trace_follower import TraceFollower, ANALYZER_VERSION
+from analysis_cache import get_rom_hash
+
+ROM_EXTENSIONS = ('.gb', '.gbc', '.sgb')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS roms (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL,
+    rom_hash TEXT,
+    size INTEGER,
+    start_pc INTEGER NOT NULL,
+    start_bank INTEGER NOT NULL,
+    version INTEGER NOT NULL,
+    chunks INTEGER,
+    bytes_covered INTEGER,
+    trace_time REAL,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS warnings (
+    rom_id INTEGER NOT NULL REFERENCES roms(id) ON DELETE CASCADE,
+    kind TEXT NOT NULL,
+    warning TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (rom_id, kind, warning)
+);
+'''
+
+
+def find_roms(patterns):
+    # expand directories (recursively) and glob patterns into sorted list of ROM files
+    paths = set()
+
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for root, _, files in os.walk(pattern):
+                paths.update(os.path.join(root, name) for name in files if name.lower().endswith(ROM_EXTENSIONS))
+
+        else:
+            paths.update(path for path in glob.glob(pattern, recursive=True) if os.path.isfile(path))
+
+    return sorted(paths)
+
+
+def analyze_rom(path, start_pc, start_bank):
+    # stats of single ROM, exceptions are reported as error instead of stopping batch
+    stats = {'path': path, 'rom_hash': None, 'size': None, 'chunks': None, 'bytes_covered': None,
+             'trace_time': None, 'error': None, 'warnings': {}}
+
+    try:
+        program = map_rom(path)
+        stats['rom_hash'] = get_rom_hash(program)
+        stats['size'] = len(program)
+
+        deasm = TraceFollower(program)
+        start_time = time.perf_counter()
+        deasm.trace_all_paths(start_pc, start_bank)
+        stats['trace_time'] = time.perf_counter() - start_time
+
+        warnings = Counter()
+
+        for chunk in deasm.chunk_cache.values():
+            warnings.update(('opcode', warning) for warning in chunk.warnings.values())
+
+            if chunk.end_warning is not None:
+                warnings[('end', chunk.end_warning)] += 1
+
+        stats['chunks'] = len(deasm.chunk_cache)
+        stats['bytes_covered'] = sum(sum(chunk.lengths) for chunk in deasm.chunk_cache.values())
+        stats['warnings'] = warnings
+
+    except Exception as e:
+        stats['error'] = '{}: {}'.format(type(e).__name__, e)
+
+    return stats
+
+
+def store_stats(db, stats, start_pc, start_bank):
+    with db:
+        rom_id = db.execute('INSERT INTO roms (path, rom_hash, size, start_pc, start_bank, version, chunks, '
+                            'bytes_covered, trace_time, error) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                            (stats['path'], stats['rom_hash'], stats['size'], start_pc, start_bank, ANALYZER_VERSION,
+                             stats['chunks'], stats['bytes_covered'], stats['trace_time'], stats['error'])).lastrowid
+
+        db.executemany('INSERT INTO warnings VALUES (?, ?, ?, ?)',
+                       ((rom_id, kind, warning, count) for (kind, warning), count in stats['warnings'].items()))
+
+
+def run_batch(patterns, db_name, jobs=1, start_pc=0x100, start_bank=1):
+    paths = find_roms(patterns)
+    db = sqlite3.connect(db_name)
+    db.execute('PRAGMA foreign_keys = ON')
+    db.executescript(SCHEMA)
+
+    if jobs <= 1:
+        results = (analyze_rom(path, start_pc, start_bank) for path in paths)
+        pool = None
+
+    else:
+        pool = ProcessPoolExecutor(jobs)
+        results = pool.map(analyze_rom, paths, [start_pc] * len(paths), [start_bank] * len(paths))
+
+    for stats in results:
+        store_stats(db, stats, start_pc, start_bank)
+
+        if stats['error'] is not None:
+            print('{}: ERROR {}'.format(stats['path'], stats['error']))
+
+        else:
+            print('{}: {} chunks, {} bytes, {:.3f} s'.format(stats['path'], stats['chunks'], stats['bytes_covered'],
+                                                             stats['trace_time']))
+
+    if pool is not None:
+        pool.shutdown()
+
+    db.close()
+
+    return len(paths)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('patterns', nargs='+', help='ROM files, directories or glob patterns')
+    parser.add_argument('--db', metavar='FILE', default='gbd_results.sqlite', help='sqlite database for results')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1, help='number of worker processes')
+    parser.add_argument('--start-pc', default='100', help='start pc [hex, default: 0x100]')
+    parser.add_argument('--start-bank', default='1', help='ROM bank [hex, default 1]')
+    args = parser.parse_args()
+
+    count = run_batch(args.patterns, args.db, args.jobs, int(args.start_pc, 16), int(args.start_bank, 16))
+
+    if count == 0:
+        print("ERROR: No ROMs found!")
+
+
+if __name__ == "__main__":
+    main()
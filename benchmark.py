@@ -0,0 +1,371 @@
+import argparse
+import contextlib
+import io
+import json
+import platform
+import random
+import resource
+import time
+import tracemalloc
+from helpers import *
+from dispatcher import *
+from decoder import *
+from trace_follower import TraceFollower, ANALYZER_VERSION
+from opcode_printer import print_opcodes
+
+SIZE_SUFFIXES = {'K': 1 << 10, 'M': 1 << 20}
+
+# straight-line opcodes used as function body filler
+FILLER_OPS = ([0x00], [0x47], [0x04], [0x80], [0x78], [0x23], [0x09], [0x7E], [0xAF], [0x3E, 0x12], [0x06, 0x34],
+              [0xE6, 0x0F], [0xCB, 0x37], [0xCB, 0x7F], [0xE0, 0x40], [0xF0, 0x44], [0xE0, 0xFF], [0x21, 0x00, 0xC0],
+              [0x11, 0x10, 0xD0], [0xEA, 0x00, 0xC1], [0xFA, 0x00, 0xC2], [0xC5, 0xC1], [0xE5, 0xD1])
+
+JR_COND_OPS = (0x20, 0x28, 0x30, 0x38)
+JP_COND_OPS = (0xC2, 0xCA, 0xD2, 0xDA)
+
+LIBRARY_SIZE = 4  # leaf functions at the end of bank 0, callable from every bank
+
+
+def parse_size(text):
+    text = text.upper().rstrip('B').rstrip('I')
+
+    if text[-1] in SIZE_SUFFIXES:
+        return int(text[:-1]) * SIZE_SUFFIXES[text[-1]]
+
+    return int(text)
+
+
+def get_rom_size_code(size):
+    # cartridge header value at 0x148, size is 32 KiB << code
+    code = 0
+
+    while (0x8000 << code) < size:
+        code += 1
+
+    return code
+
+
+class RomGenerator:
+    # deterministic synthetic ROM: every bank is a tree of functions rooted at bank start, bank 0 main routine
+    # switches to every bank and calls its root
+    def __init__(self, size=0x8000, seed=0, branch_density=0.1, call_fan_in=4, jump_tables=16, bank_switch_rate=0.01):
+        if size < 0x8000 or size % 0x4000 != 0:
+            raise ValueError('ROM size must be multiple of 16 KiB, at least 32 KiB')
+
+        self.size = size
+        self.banks = size // 0x4000
+        self.random = random.Random(seed)
+        self.branch_density = branch_density
+        self.call_fan_in = max(1, call_fan_in)
+        self.jump_tables = jump_tables
+        self.bank_switch_rate = bank_switch_rate
+        self.functions = {}  # bank -> list of function start addresses (CPU view)
+
+    def get_function_sizes(self, start, end):
+        sizes = []
+
+        while True:
+            size = self.random.randrange(32, 256)
+
+            if start + sum(sizes) + size > end:
+                return sizes
+
+            sizes.append(size)
+
+    def get_body(self, bank, index, size):
+        # list of opcodes (lists of bytes) of single function, ends with RET or jump table dispatch,
+        # only bank 0 functions switch banks, they are called only from bank 0
+        functions = self.functions[bank]
+        library = self.functions[0][-LIBRARY_SIZE:]
+        tree = functions if bank != 0 else functions[:-LIBRARY_SIZE]
+        hubs = tree[:max(1, len(tree) // self.call_fan_in)] + library
+        is_library = index >= len(tree)
+        body = []
+        length = 0
+
+        # children in function tree, every function is reachable from bank root
+        for child in (2 * index + 1, 2 * index + 2):
+            if child < len(tree):
+                body.append([0xCD, tree[child] & 0xFF, tree[child] >> 8])
+                length += 3
+
+        use_jump_table = not is_library and self.random.random() < self.jump_tables / (len(tree) * self.banks)
+        tail = 12 if use_jump_table else 1
+
+        while True:
+            k = self.random.random()
+
+            if k < self.branch_density:
+                op = [self.random.choice(JR_COND_OPS), 0] if self.random.random() < 0.7 else \
+                    [self.random.choice(JP_COND_OPS), 0, 0]
+
+            elif k < self.branch_density + 0.05 and not is_library:
+                target = self.random.choice(hubs)
+                op = [0xCD, target & 0xFF, target >> 8]
+
+            elif k < self.branch_density + 0.05 + self.bank_switch_rate and bank == 0 and not is_library and \
+                    self.banks > 2:
+                new_bank = self.random.randrange(1, self.banks)
+                target = self.random.choice(self.functions[new_bank][:4])
+                op = self.get_bank_switch(new_bank) + [0xCD, target & 0xFF, target >> 8]
+
+            else:
+                op = list(self.random.choice(FILLER_OPS))
+
+            if length + len(op) + tail > size:
+                break
+
+            body.append(op)
+            length += len(op)
+
+        if use_jump_table:  # LD HL,nn; JP (HL) followed by pointer table
+            target = self.random.choice(hubs)
+            body.append([0x21, target & 0xFF, target >> 8, 0xE9])
+            body.append(bytes(byte for function in hubs[:4] for byte in (function & 0xFF, function >> 8)))
+
+        else:
+            body.append([0xC9])
+
+        return body
+
+    def get_bank_switch(self, bank):
+        ops = []
+
+        if self.banks > 0x100:  # MBC5 9th bank bit
+            ops += [0x3E, bank >> 8, 0xEA, 0x00, 0x30]
+
+        return ops + [0x3E, bank & 0xFF, 0xEA, 0x00, 0x21]
+
+    def emit_function(self, rom, offset, start, body):
+        # write body at CPU address start (ROM offset), resolve conditional branches to later opcodes
+        positions = []
+        address = start
+
+        for op in body:
+            positions.append(address)
+            address += len(op)
+
+        for i, op in enumerate(body):
+            if isinstance(op, bytes):  # data
+                continue
+
+            if op[0] in JR_COND_OPS or op[0] in JP_COND_OPS:
+                next_address = positions[i] + len(op)
+                candidates = [p for p in positions[i + 1:i + 20] if p - next_address <= 127]
+                target = self.random.choice(candidates) if candidates else next_address
+
+                if op[0] in JR_COND_OPS:
+                    op[1] = (target - next_address) & 0xFF
+
+                else:
+                    op[1], op[2] = target & 0xFF, target >> 8
+
+        code = bytes(byte for op in body for byte in op)
+        rom[offset:offset + len(code)] = code
+
+    def generate(self):
+        rom = bytearray(self.size)
+
+        for vector in range(0, 0x68, 8):  # RST and interrupt vectors
+            rom[vector] = 0xC9
+
+        rom[0x100:0x104] = bytes([0x00, 0xC3, 0x50, 0x01])
+        rom[0x147] = 0x19  # MBC5
+        rom[0x148] = get_rom_size_code(self.size)
+
+        main_size = 3 + (self.banks - 1) * len(self.get_bank_switch(self.banks - 1) + [0xCD, 0, 0]) + 2
+        layouts = {}
+
+        for bank in range(self.banks):
+            start = 0x150 + main_size if bank == 0 else 0x4000
+            sizes = self.get_function_sizes(start, 0x4000 if bank == 0 else 0x8000)
+            layouts[bank] = sizes
+            self.functions[bank] = [start + sum(sizes[:i]) for i in range(len(sizes))]
+
+        # main routine: call bank 0 root, then root of every switchable bank, then loop forever
+        main = [[0xCD, self.functions[0][0] & 0xFF, self.functions[0][0] >> 8]]
+
+        for bank in range(1, self.banks):
+            main.append(self.get_bank_switch(bank) + [0xCD, 0x00, 0x40])
+
+        main.append([0x18, 0xFE])
+        self.emit_function(rom, 0x150, 0x150, main)
+
+        for bank in range(self.banks):
+            for index, (start, size) in enumerate(zip(self.functions[bank], layouts[bank])):
+                offset = start if bank == 0 else bank * 0x4000 + start - 0x4000
+                self.emit_function(rom, offset, start, self.get_body(bank, index, size))
+
+        return bytes(rom)
+
+
+def generate_rom(size=0x8000, seed=0, branch_density=0.1, call_fan_in=4, jump_tables=16, bank_switch_rate=0.01):
+    return RomGenerator(size, seed, branch_density, call_fan_in, jump_tables, bank_switch_rate).generate()
+
+
+def get_phase(seconds, instructions, peak_memory=None):
+    phase = {'seconds': seconds, 'instructions': instructions,
+             'instructions_per_second': instructions / seconds if seconds > 0 else None}
+
+    if peak_memory is not None:
+        phase['peak_memory'] = peak_memory
+
+    return phase
+
+
+def best_time(function, repeat):
+    # (best wall time, result of last call)
+    best = None
+
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start_time
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best, result
+
+
+def bench_trace(program, repeat):
+    def trace():
+        follower = TraceFollower(program)
+        follower.trace_all_paths(0x100, 1)
+
+        return follower
+
+    seconds, follower = best_time(trace, repeat)
+
+    tracemalloc.start()
+    trace()
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    instructions = sum(len(chunk) for chunk in follower.chunk_cache.values())
+
+    return follower.chunk_cache, get_phase(seconds, instructions, peak_memory)
+
+
+def bench_split(chunk_index, repeat):
+    # split copy of every chunk in half and grow head again, so it has to copy shared opcodes
+    def split():
+        for chunk in pairs:
+            head = Chunk()
+            head.extend(chunk)
+            tail = head.split(len(head) // 2)
+            head.extend(tail)
+
+    pairs = [chunk for chunk in chunk_index.values() if len(chunk) >= 2]
+    seconds, _ = best_time(split, repeat)
+
+    return get_phase(seconds, sum(len(chunk) for chunk in pairs))
+
+
+def bench_resolvers(chunk_index, cartridge, repeat):
+    # replay register tracking, bank and HL resolving over traced opcodes
+    def resolve():
+        for chunk in chunk_index.values():
+            reg_state = RegisterState(scratch)
+
+            for index, opcode in enumerate(chunk.codes):
+                mods = get_mods(opcode)
+
+                if mods:
+                    reg_state.update(index, chunk.args[index], mods)
+
+                flow = get_flow(opcode)
+
+                if flow == FLOW_STORE_A and cartridge.is_bank_write(chunk.args[index]):
+                    try:
+                        get_new_bank(reg_state, cartridge, chunk.args[index], 1)
+
+                    except Exception:
+                        pass
+
+                elif flow == FLOW_JP_HL:
+                    get_hl_mod(reg_state)
+
+    scratch = Chunk()  # resolvers annotate opcodes, don't touch traced chunks
+    seconds, _ = best_time(resolve, repeat)
+
+    return get_phase(seconds, sum(len(chunk) for chunk in chunk_index.values()))
+
+
+def bench_print(chunk_index, repeat):
+    def print_all():
+        with contextlib.redirect_stdout(io.StringIO()):
+            for chunk in chunk_index.values():
+                print_opcodes(chunk)
+
+    seconds, _ = best_time(print_all, repeat)
+
+    return get_phase(seconds, sum(len(chunk) for chunk in chunk_index.values()))
+
+
+def run_benchmark(size, seed=0, repeat=3, **generator_args):
+    program = generate_rom(size, seed, **generator_args)
+    chunk_index, trace_phase = bench_trace(program, repeat)
+
+    return {'size': size, 'seed': seed, 'generator': generator_args, 'chunks': len(chunk_index),
+            'phases': {'trace_all_paths': trace_phase,
+                       'split_chunks': bench_split(chunk_index, repeat),
+                       'resolvers': bench_resolvers(chunk_index, Cartridge(program), repeat),
+                       'print_opcodes': bench_print(chunk_index, repeat)}}
+
+
+def compare_results(base, new):
+    # speedup of every phase, > 1 means new revision is faster
+    base_runs = {(run['size'], run['seed']): run for run in base['runs']}
+
+    for run in new['runs']:
+        base_run = base_runs.get((run['size'], run['seed']))
+
+        if base_run is None:
+            continue
+
+        for name, phase in run['phases'].items():
+            base_phase = base_run['phases'].get(name)
+
+            if base_phase is not None and phase['seconds'] > 0:
+                print('{:>8} {:<16} {:10.4f} s -> {:10.4f} s  x{:.2f}'.format(
+                    '{}K'.format(run['size'] >> 10), name, base_phase['seconds'], phase['seconds'],
+                    base_phase['seconds'] / phase['seconds']))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', default='32K,256K,1M', help='comma separated ROM sizes (32K ~ 8M)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3, help='runs per phase, best time is reported')
+    parser.add_argument('--branch-density', type=float, default=0.1, help='conditional branches per opcode')
+    parser.add_argument('--call-fan-in', type=int, default=4, help='average callers of called function')
+    parser.add_argument('--jump-tables', type=int, default=16, help='JP (HL) dispatches per ROM')
+    parser.add_argument('--bank-switch-rate', type=float, default=0.01, help='bank switching calls per opcode')
+    parser.add_argument('--output', metavar='FILE', default=None, help='save results as JSON')
+    parser.add_argument('--compare', metavar='FILE', default=None, help='compare with results saved in FILE')
+    args = parser.parse_args()
+
+    generator_args = {'branch_density': args.branch_density, 'call_fan_in': args.call_fan_in,
+                      'jump_tables': args.jump_tables, 'bank_switch_rate': args.bank_switch_rate}
+    results = {'analyzer_version': ANALYZER_VERSION, 'python': platform.python_version(), 'runs': []}
+
+    for size in args.sizes.split(','):
+        run = run_benchmark(parse_size(size), args.seed, args.repeat, **generator_args)
+        results['runs'].append(run)
+
+        for name, phase in run['phases'].items():
+            print('{:>8} {:<16} {:10.4f} s {:12.0f} instr/s'.format(
+                '{}K'.format(run['size'] >> 10), name, phase['seconds'], phase['instructions_per_second'] or 0))
+
+    results['max_rss_kib'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    if args.output is not None:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+
+    if args.compare is not None:
+        with open(args.compare) as file:
+            compare_results(json.load(file), results)
+
+
+if __name__ == "__main__":
+    main()
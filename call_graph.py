@@ -0,0 +1,287 @@
+import heapq
+from array import array
+from collections import deque
+from helpers import calculate_internal_address
+from opcode_printer import format_address
+from xrefs import XREF_CALL, XREF_JUMP
+from decoder import falls_through
+
+GRAPH_DOT = 'dot'
+GRAPH_GRAPHML = 'graphml'
+GRAPH_FORMATS = (GRAPH_DOT, GRAPH_GRAPHML)
+
+
+def build_csr(node_count, edges):
+    # offsets and targets arrays of (source, target) edges, targets of node i are targets[offsets[i]:offsets[i + 1]]
+    offsets = array('I', bytes(4 * (node_count + 1)))
+
+    for source, _ in edges:
+        offsets[source + 1] += 1
+
+    for node in range(node_count):
+        offsets[node + 1] += offsets[node]
+
+    targets = array('I', bytes(4 * len(edges)))
+    positions = offsets[:-1]
+
+    for source, target in edges:
+        targets[positions[source]] = target
+        positions[source] += 1
+
+    return offsets, targets
+
+
+def get_body_edges(index, xrefs):
+    # (source chunk, target chunk) positions in chunk index of jumps and fall through between chunks
+    edges = set()
+
+    for target, source in zip(xrefs.targets[XREF_JUMP], xrefs.sources[XREF_JUMP]):
+        source_pos = index.find(source)
+        target_pos = index.find(target)
+
+        if source_pos >= 0 and target_pos >= 0:
+            edges.add((source_pos, target_pos))
+
+    for pos, chunk in enumerate(index.chunks):
+        if falls_through(chunk):
+            next_pos = index.find(chunk.end + 1)
+
+            if next_pos >= 0:
+                edges.add((pos, next_pos))
+
+    return list(edges)
+
+
+class CallGraph:
+    # routines and calls between them, routines are call targets, entry points and chunks nothing leads to,
+    # chunks belong to first routine reaching them through jumps and fall through, jump or fall through to
+    # start of another routine is tail call, node i is routine at nodes[i], its callees are
+    # targets[offsets[i]:offsets[i + 1]]
+    def __init__(self, index, xrefs, entries=()):
+        xrefs.sort()
+
+        self.nodes = array('I')  # node -> internal address of routine
+        self.node_ids = {}  # internal address -> node
+
+        chunk_count = len(index)
+        body_offsets, body_targets = build_csr(chunk_count, get_body_edges(index, xrefs))
+        has_predecessor = bytearray(chunk_count)
+        owners = array('i', [-1]) * chunk_count  # chunk position -> node of routine containing it
+        edges = set()
+
+        for target in body_targets:
+            has_predecessor[target] = 1
+
+        starts = [calculate_internal_address(pc, bank) for pc, bank in entries]
+        starts.extend(xrefs.targets[XREF_CALL])
+
+        for address in starts:
+            pos = index.find(address)
+
+            if pos >= 0:
+                has_predecessor[pos] = 1
+
+        for address in starts:
+            self._add_node(index, address, owners)
+
+        entry_addresses = starts[:len(entries)]
+        self.entries = sorted({self.node_ids[address] for address in entry_addresses if address in self.node_ids})
+
+        for pos, start in enumerate(index.starts):
+            if not has_predecessor[pos]:
+                self._add_node(index, start, owners)
+
+        pending = deque(pos for pos in range(chunk_count) if owners[pos] >= 0)
+        unowned = 0
+
+        while True:
+            while pending:
+                pos = pending.popleft()
+                owner = owners[pos]
+
+                for target in body_targets[body_offsets[pos]:body_offsets[pos + 1]]:
+                    if owners[target] < 0:
+                        owners[target] = owner
+                        pending.append(target)
+
+                    elif owners[target] != owner and index.starts[target] in self.node_ids:
+                        edges.add((owner, self.node_ids[index.starts[target]]))
+
+            # chunks only reachable from each other (loops entered through unresolved jumps)
+            while unowned < chunk_count and owners[unowned] >= 0:
+                unowned += 1
+
+            if unowned == chunk_count:
+                break
+
+            self._add_node(index, index.starts[unowned], owners)
+            pending.append(unowned)
+
+        for target, source in zip(xrefs.targets[XREF_CALL], xrefs.sources[XREF_CALL]):
+            pos = index.find(source)
+
+            if pos >= 0 and target in self.node_ids:
+                edges.add((owners[pos], self.node_ids[target]))
+
+        self.offsets, self.targets = build_csr(len(self.nodes), sorted(edges))
+        self.fan_in = array('I', bytes(4 * len(self.nodes)))
+
+        for target in self.targets:
+            self.fan_in[target] += 1
+
+    def _add_node(self, index, address, owners):
+        if address in self.node_ids:
+            return
+
+        pos = index.find(address)
+
+        if pos < 0:
+            return
+
+        self.node_ids[address] = len(self.nodes)
+        self.nodes.append(address)
+
+        if owners[pos] < 0:
+            owners[pos] = self.node_ids[address]
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def get_callees(self, node):
+        return self.targets[self.offsets[node]:self.offsets[node + 1]]
+
+    def get_fan_out(self, node):
+        return self.offsets[node + 1] - self.offsets[node]
+
+    def get_reachable(self, roots):
+        # bytearray, 1 for nodes called directly or indirectly from roots (roots included)
+        reached = bytearray(len(self.nodes))
+        pending = list(roots)
+
+        for node in pending:
+            reached[node] = 1
+
+        while pending:
+            node = pending.pop()
+
+            for target in self.get_callees(node):
+                if not reached[target]:
+                    reached[target] = 1
+                    pending.append(target)
+
+        return reached
+
+    def get_unreached(self):
+        # nodes not called from entry points, dead routines or targets of unresolved jumps
+        reached = self.get_reachable(self.entries)
+
+        return [node for node in range(len(self.nodes)) if not reached[node]]
+
+    def get_components(self):
+        # strongly connected components, iterative Tarjan, callees come before callers
+        offsets, targets = self.offsets, self.targets
+        order = array('i', [-1]) * len(self.nodes)
+        low = array('i', [0]) * len(self.nodes)
+        on_stack = bytearray(len(self.nodes))
+        stack = []
+        components = []
+        counter = 0
+
+        for root in range(len(self.nodes)):
+            if order[root] >= 0:
+                continue
+
+            order[root] = low[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack[root] = 1
+            work = [(root, offsets[root])]
+
+            while work:
+                node, pos = work[-1]
+
+                if pos < offsets[node + 1]:
+                    work[-1] = (node, pos + 1)
+                    target = targets[pos]
+
+                    if order[target] < 0:
+                        order[target] = low[target] = counter
+                        counter += 1
+                        stack.append(target)
+                        on_stack[target] = 1
+                        work.append((target, offsets[target]))
+
+                    elif on_stack[target] and order[target] < low[node]:
+                        low[node] = order[target]
+
+                    continue
+
+                work.pop()
+
+                if work and low[node] < low[work[-1][0]]:
+                    low[work[-1][0]] = low[node]
+
+                if low[node] == order[node]:
+                    component = []
+
+                    while True:
+                        member = stack.pop()
+                        on_stack[member] = 0
+                        component.append(member)
+
+                        if member == node:
+                            break
+
+                    components.append(component)
+
+        return components
+
+    def get_recursions(self):
+        # components with more than one routine or routine calling itself
+        return [sorted(component) for component in self.get_components()
+                if len(component) > 1 or component[0] in self.get_callees(component[0])]
+
+    def rank_fan_in(self, count):
+        return heapq.nlargest(count, range(len(self.nodes)), key=lambda node: (self.fan_in[node], -node))
+
+    def rank_fan_out(self, count):
+        return heapq.nlargest(count, range(len(self.nodes)), key=lambda node: (self.get_fan_out(node), -node))
+
+
+def write_dot(graph, stream):
+    stream.write('digraph calls {\n')
+
+    for node, address in enumerate(graph.nodes):
+        shape = ' shape=box' if node in graph.entries else ''
+        stream.write('  n{} [label="{}"{}];\n'.format(node, format_address(address), shape))
+
+    for node in range(len(graph)):
+        for target in graph.get_callees(node):
+            stream.write('  n{} -> n{};\n'.format(node, target))
+
+    stream.write('}\n')
+
+
+def write_graphml(graph, stream):
+    stream.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                 '<graphml xmlns="http://graphml.graphdrawing.org/xmlns">\n'
+                 '  <key id="address" for="node" attr.name="address" attr.type="string"/>\n'
+                 '  <key id="fan_in" for="node" attr.name="fan_in" attr.type="int"/>\n'
+                 '  <key id="fan_out" for="node" attr.name="fan_out" attr.type="int"/>\n'
+                 '  <graph id="calls" edgedefault="directed">\n')
+
+    for node, address in enumerate(graph.nodes):
+        stream.write('    <node id="n{}"><data key="address">{}</data><data key="fan_in">{}</data>'
+                     '<data key="fan_out">{}</data></node>\n'
+                     .format(node, format_address(address), graph.fan_in[node], graph.get_fan_out(node)))
+
+    for node in range(len(graph)):
+        for target in graph.get_callees(node):
+            stream.write('    <edge source="n{}" target="n{}"/>\n'.format(node, target))
+
+    stream.write('  </graph>\n'
+                 '</graphml>\n')
+
+
+def get_graph_writer(graph_format):
+    return write_dot if graph_format == GRAPH_DOT else write_graphml
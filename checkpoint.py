@@ -0,0 +1,64 @@
+import os
+import pickle
+import time
+from analysis_cache import get_rom_hash
+from trace_follower import ANALYZER_VERSION, CHECKPOINT_INTERVAL
+
+
+class TraceCheckpoint:
+    # tracer state (chunks, visit queue, cross references, function summaries) saved to file, file is replaced
+    # only after new state is completely written, so killed process leaves last complete checkpoint behind
+    def __init__(self, file_name, program, start_pc, start_bank, mode, interval=CHECKPOINT_INTERVAL):
+        self.file_name = file_name
+        self.key = (get_rom_hash(program), start_pc, start_bank, mode, ANALYZER_VERSION)
+        self.interval = interval
+        self.last_time = time.perf_counter()
+        self.saves = 0
+
+    def is_due(self):
+        return time.perf_counter() - self.last_time >= self.interval
+
+    def save(self, follower):
+        state = {'key': self.key, 'chunks': list(follower.chunk_cache.values()), 'visit_queue': follower.visit_queue,
+                 'xrefs': follower.xrefs, 'summaries': follower.summaries, 'local_jumps': follower.local_jumps,
+                 'chunk_states': follower.chunk_states, 'instructions': follower.instructions}
+        temp_name = self.file_name + '.tmp'
+
+        with open(temp_name, 'wb') as stream:
+            pickle.dump(state, stream, pickle.HIGHEST_PROTOCOL)
+            stream.flush()
+            os.fsync(stream.fileno())
+
+        os.replace(temp_name, self.file_name)
+        self.last_time = time.perf_counter()
+        self.saves += 1
+
+    def restore(self, follower):
+        # load state into new follower, False if there is no checkpoint or it belongs to other analysis
+        try:
+            with open(self.file_name, 'rb') as stream:
+                state = pickle.load(stream)
+
+        except FileNotFoundError:
+            return False
+
+        if state['key'] != self.key:
+            return False
+
+        for chunk in state['chunks']:  # follower's own chunk index class is kept
+            follower.chunk_cache.insert(chunk)
+
+        follower.visit_queue = state['visit_queue']
+        follower.xrefs = state['xrefs']
+        follower.summaries = state['summaries']
+        follower.local_jumps = state['local_jumps']
+        follower.chunk_states = state['chunk_states']
+        follower.instructions = state['instructions']
+
+        return True
+
+    def remove(self):
+        # finished analysis doesn't need checkpoint anymore
+        for file_name in (self.file_name, self.file_name + '.tmp'):
+            if os.path.exists(file_name):
+                os.remove(file_name)
@@ -0,0 +1,179 @@
+import os
+from opcodes import op_len
+from dispatcher import *
+# per opcode metadata precompiled from opcode families below, opcodes 0xCB00 ~ 0xCBFF are stored at index
+# 0x100 ~ 0x1FF, op_decode is first byte -> (opcode length, control flow class, register effects) for decoder inner loop
+from opcode_tables import op_arg, op_flow, op_mods, op_decode
+
+# opcode families
+PUSH_FAMILY = {0xC5, 0xD5, 0xE5, 0xF5}
+POP_FAMILY = {0xC1, 0xD1, 0xE1, 0xF1}
+RST_FAMILY = {0xC7, 0xCF, 0xD7, 0xDF, 0xE7, 0xEF, 0xF7, 0xFF}
+JUMP_FAMILY = {0x18, 0xC3}
+RET_FAMILY = {0xC9, 0xD9}
+
+JR_COND_FAMILY = {0x20, 0x28, 0x30, 0x38}
+RET_COND_FAMILY = {0xC0, 0xC8, 0xD0, 0xD8}
+JP_COND_FAMILY = {0xC2, 0xCA, 0xD2, 0xDA}
+CALL_FAMILY = {0xCD, 0xC4, 0xCC, 0xD4, 0xDC}
+JR_FAMILY = JR_COND_FAMILY | {0x18}
+
+# operand kinds
+ARG_NONE = 0
+ARG_U8 = 1
+ARG_U16 = 2
+ARG_REL8 = 3
+ARG_EXT = 4
+
+# control flow classes, every class other than FLOW_NONE stops decoded run
+FLOW_NONE = 0
+FLOW_PUSH = 1
+FLOW_POP = 2
+FLOW_STORE_A = 3  # LD (nn),A - possible bank switch
+FLOW_RET_COND = 4
+FLOW_JR_COND = 5
+FLOW_JP_COND = 6
+FLOW_CALL = 7
+FLOW_RST = 8
+FLOW_JR = 9
+FLOW_JP = 10
+FLOW_JP_HL = 11
+FLOW_RET = 12
+FLOW_OVERLAP = -1  # not an opcode class, decoded opcode overlaps beginning of next chunk
+FLOW_OUT_OF_ROM = -2  # not an opcode class, next opcode doesn't fit in ROM
+
+# FLOW_JR_COND <= flow <= FLOW_RST causes split, flow >= FLOW_JR ends chunk
+FLOW_SPLIT_FIRST = FLOW_JR_COND
+FLOW_SPLIT_LAST = FLOW_RST
+FLOW_END_FIRST = FLOW_JR
+
+
+def _get_arg_kind(opcode):
+    if opcode == 0xCB:
+        return ARG_EXT
+
+    elif opcode in JR_FAMILY:
+        return ARG_REL8
+
+    return (ARG_NONE, ARG_NONE, ARG_U8, ARG_U16)[op_len[opcode]]
+
+
+def _get_flow(opcode):
+    families = ((PUSH_FAMILY, FLOW_PUSH), (POP_FAMILY, FLOW_POP), ({0xEA}, FLOW_STORE_A),
+                (RET_COND_FAMILY, FLOW_RET_COND), (JR_COND_FAMILY, FLOW_JR_COND), (JP_COND_FAMILY, FLOW_JP_COND),
+                (CALL_FAMILY, FLOW_CALL), (RST_FAMILY, FLOW_RST), ({0x18}, FLOW_JR), ({0xC3}, FLOW_JP),
+                ({0xE9}, FLOW_JP_HL), (RET_FAMILY, FLOW_RET))
+
+    for family, flow in families:
+        if opcode in family:
+            return flow
+
+    return FLOW_NONE
+
+
+def _get_mods(opcode):
+    if opcode == 0x3E:
+        mods = LOAD_A
+
+    elif opcode == 0xAF:
+        mods = ZERO_A
+
+    else:
+        mods = MOD_A if opcode in A_MODS else 0
+
+    if opcode == 0x21:
+        mods |= LOAD_HL
+
+    elif opcode in HL_MODS:
+        mods |= MOD_HL
+
+    return mods
+
+
+def build_tables():
+    # name -> table of opcode_tables.py
+    op_arg = [_get_arg_kind(i) for i in range(0x100)] + [ARG_NONE] * 0x100
+    op_flow = [_get_flow(i) for i in range(0x100)] + [FLOW_NONE] * 0x100
+    op_mods = [_get_mods(i) for i in range(0x100)] + [_get_mods(0xCB00 + i) for i in range(0x100)]
+    op_decode = [(op_len[i], op_flow[i], op_mods[i]) for i in range(0x100)]
+
+    return {'op_arg': op_arg, 'op_flow': op_flow, 'op_mods': op_mods, 'op_decode': op_decode}
+
+
+def write_tables(file_name=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'opcode_tables.py')):
+    # regenerate opcode_tables.py after changing opcode families or register effects
+    with open(file_name, 'w') as stream:
+        stream.write('# generated by "python decoder.py" from opcode families in decoder.py, don\'t edit\n')
+
+        for name, table in build_tables().items():
+            per_row = 8 if isinstance(table[0], tuple) else 16
+            rows = [', '.join(repr(value) for value in table[i:i + per_row]) for i in range(0, len(table), per_row)]
+            stream.write('\n{} = (\n    {},\n)\n'.format(name, ',\n    '.join(rows)))
+
+
+def get_op_index(opcode):
+    return opcode if opcode <= 0xFF else opcode - 0xCB00 + 0x100
+
+
+def get_flow(opcode):
+    return op_flow[get_op_index(opcode)]
+
+
+def get_mods(opcode):
+    return op_mods[get_op_index(opcode)]
+
+
+def falls_through(chunk):
+    # chunk continues in chunk starting right after it
+    return get_flow(chunk.codes[-1]) < FLOW_END_FIRST and chunk.end_warning is None and \
+        chunk.infos.get(len(chunk) - 1) != 'Function never returns'
+
+
+def decode_run(view, pos, end, base_address, chunk, reg_state):
+    # decode opcodes from view[pos:end] into chunk until opcode with control flow class other than FLOW_NONE
+    # (inclusive) or until next opcode doesn't fit before end, register effects go to reg_state
+    addresses, codes, args, lengths = chunk.addresses, chunk.codes, chunk.args, chunk.lengths
+    index = len(addresses)
+    flow = FLOW_NONE
+
+    while pos < end:
+        opcode = view[pos]
+        length, flow, mods = op_decode[opcode]
+
+        if pos + length > end:
+            flow = FLOW_NONE
+            break
+
+        if length == 1:
+            optional_arg = 0
+
+        elif opcode == 0xCB:
+            mods = op_mods[0x100 | view[pos + 1]]
+            opcode = 0xCB00 | view[pos + 1]
+            optional_arg = 0
+
+        elif length == 2:
+            optional_arg = view[pos + 1]
+
+        else:
+            optional_arg = (view[pos + 2] << 8) | view[pos + 1]
+
+        addresses.append(base_address + pos)
+        codes.append(opcode)
+        args.append(optional_arg)
+        lengths.append(length)
+        pos += length
+
+        if mods:
+            reg_state.update(index, optional_arg, mods)
+
+        index += 1
+
+        if flow != FLOW_NONE:
+            break
+
+    return pos, flow
+
+
+if __name__ == '__main__':
+    write_tables()
@@ -1,36 +1,570 @@
+import argparse
 import sys
-import colorama
-from opcode_printer import print_opcodes
-from trace_follower import TraceFollower
+from bisect import bisect_left
+from contextlib import nullcontext
+from opcode_printer import OUTPUT_FORMATS, FORMAT_TEXT, HW_REGISTERS, get_writer, open_output, format_address, \
+    get_mnemonic
+from helpers import Chunk, map_rom, calculate_internal_address
+from decoder import FLOW_END_FIRST, get_flow
+from trace_follower import TraceFollower, TraceBudget, ANALYZER_VERSION, CHECKPOINT_INTERVAL, get_entry_points
+from xrefs import XREF_KINDS, XREF_CALL, XREF_JUMP, XREF_READ, XREF_WRITE
 
+# modules used only by some commands or options (multiprocessing, sqlite, pickle, colorama) are imported where
+# they are used, so short lookups don't pay for them at startup
 
-def main():
-    if 2 <= len(sys.argv) <= 4:
-        file_name = sys.argv[1]
-        start_pc = int(sys.argv[2], 16) if len(sys.argv) >= 3 else 0x100
-        start_bank = int(sys.argv[3], 16) if len(sys.argv) >= 4 else 1
 
-        try:
-            with open(file_name, 'rb') as file:
-                binary = file.read()
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('file_name', help='ROM file')
+    parser.add_argument('start_pc', nargs='?', default='100', help='start pc [hex, default: 0x100]')
+    parser.add_argument('start_bank', nargs='?', default='1', help='ROM bank [hex, default 1]')
+    parser.add_argument('--jobs', type=int, default=None,
+                        help='trace entry points in N processes, entry points reaching the same code are traced '
+                             'together, result is the same as without --jobs')
+    parser.add_argument('--vectors', action='store_true', help='also trace from RST and interrupt vectors')
+    parser.add_argument('--cache', metavar='FILE', default=None,
+                        help='reuse analyses stored in sqlite database FILE, store new ones there')
+    parser.add_argument('--stream', action='store_true',
+                        help='print chunks in discovery order while tracing, chunks are not split afterwards')
+    parser.add_argument('--sweep', action='store_true',
+                        help='also trace code-like regions not reached from start pc, marked with info')
+    parser.add_argument('--exec-log', metavar='FILE', default=None,
+                        help='trace code executed in emulator log FILE, mark traced chunks it never executed')
+    parser.add_argument('--exec-log-format', choices=('text', 'binary'), default=None,  # execution_log.LOG_FORMATS
+                        help='format of --exec-log [default: binary for *.bin, else text]')
+    parser.add_argument('--max-time', type=float, metavar='SECONDS', default=None,
+                        help='stop tracing after SECONDS and print partial results')
+    parser.add_argument('--max-instructions', type=int, metavar='N', default=None,
+                        help='stop tracing after N decoded instructions and print partial results')
+    parser.add_argument('--max-chunks', type=int, metavar='N', default=None,
+                        help='stop tracing at N chunks and print partial results')
+    parser.add_argument('--checkpoint', metavar='FILE', default=None,
+                        help='save tracer state to FILE periodically and when stopped by limit, resume from it if it '
+                             'exists, removed when tracing finishes')
+    parser.add_argument('--checkpoint-interval', type=float, metavar='SECONDS', default=CHECKPOINT_INTERVAL,
+                        help='seconds between checkpoints [default: {}]'.format(CHECKPOINT_INTERVAL))
+    parser.add_argument('--format', choices=OUTPUT_FORMATS, default=FORMAT_TEXT, help='output format')
+    parser.add_argument('--output', metavar='FILE', default=None, help='write output to FILE instead of stdout')
+    parser.add_argument('--stats', action='store_true',
+                        help='print tracer counters and phase times to stderr, counters of --jobs workers are summed')
+    parser.add_argument('--profile', metavar='FILE', default=None, help='save cProfile stats to FILE, implies --stats')
+
+    args = parser.parse_args()
+
+    if args.stream and (args.jobs is not None or args.cache is not None or args.sweep or args.vectors):
+        parser.error('--stream can\'t be used with --jobs, --cache, --sweep or --vectors')
+
+    if args.exec_log is not None and (args.stream or args.cache is not None):
+        parser.error('--exec-log can\'t be used with --stream or --cache')
+
+    args.budget = args.max_time is not None or args.max_instructions is not None or args.max_chunks is not None
+
+    if (args.budget or args.checkpoint is not None) and (args.stream or args.jobs is not None):
+        parser.error('--max-* and --checkpoint can\'t be used with --stream or --jobs')
+
+    return args
+
+
+def parse_xref_args(argv):
+    parser = argparse.ArgumentParser(prog='disasm.py xref', description='list references to code or HW register')
+    parser.add_argument('file_name', help='ROM file')
+    parser.add_argument('start_pc', nargs='?', default='100', help='start pc [hex, default: 0x100]')
+    parser.add_argument('start_bank', nargs='?', default='1', help='ROM bank [hex, default 1]')
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--to', metavar='ADDRESS[:BANK]', help='calls and jumps to code address [hex, default bank 1]')
+    target.add_argument('--register', metavar='NAME', help='LDH accesses of HW register [name or hex]')
+    parser.add_argument('--kind', choices=XREF_KINDS, default=None, help='list only references of this kind')
+    parser.add_argument('--cache', metavar='FILE', default=None,
+                        help='load analysis from sqlite database FILE, store it there if missing')
+
+    args = parser.parse_args(argv)
+
+    try:
+        args.target = parse_code_address(args.to) if args.to is not None else 0xFF00 | parse_register(args.register)
+
+    except ValueError:
+        parser.error('invalid address or register: {}'.format(args.to if args.to is not None else args.register))
+
+    return args
+
+
+def parse_search_args(argv):
+    parser = argparse.ArgumentParser(prog='disasm.py search', description='find instruction patterns in all ROM banks')
+    parser.add_argument('file_name', help='ROM file')
+    parser.add_argument('start_pc', nargs='?', default='100', help='start pc for --traced [hex, default: 0x100]')
+    parser.add_argument('start_bank', nargs='?', default='1', help='ROM bank for --traced [hex, default 1]')
+    parser.add_argument('--pattern', '-p', action='append', required=True,
+                        help='instructions separated by ";", mnemonics (LDH (0x40),A; JP (HL)) or hex bytes '
+                             '(EA 00 20), "?" is wildcard argument, "??" wildcard byte, can be repeated')
+    parser.add_argument('--traced', action='store_true', help='list only matches starting at traced opcode')
+
+    args = parser.parse_args(argv)
+
+    from search import compile_pattern
+
+    try:
+        args.patterns = [compile_pattern(text) for text in args.pattern]
+
+    except ValueError as e:
+        parser.error(str(e))
+
+    return args
+
+
+def parse_diff_args(argv):
+    parser = argparse.ArgumentParser(prog='disasm.py diff',
+                                     description='analyze patched ROM reusing analysis of original ROM, list changes')
+    parser.add_argument('old_file_name', help='original ROM file')
+    parser.add_argument('file_name', help='patched ROM file')
+    parser.add_argument('start_pc', nargs='?', default='100', help='start pc [hex, default: 0x100]')
+    parser.add_argument('start_bank', nargs='?', default='1', help='ROM bank [hex, default 1]')
+    parser.add_argument('--cache', metavar='FILE', default=None,
+                        help='load analysis of original ROM from sqlite database FILE, store it there if missing')
+    parser.add_argument('--verify', action='store_true',
+                        help='compare with full trace of patched ROM, list changes of full trace if they differ')
+
+    return parser.parse_args(argv)
+
+
+def parse_call_graph_args(argv):
+    from call_graph import GRAPH_FORMATS
+
+    parser = argparse.ArgumentParser(prog='disasm.py callgraph',
+                                     description='routine call graph: fan-in/fan-out, recursion, unreached routines')
+    parser.add_argument('file_name', help='ROM file')
+    parser.add_argument('start_pc', nargs='?', default='100', help='start pc [hex, default: 0x100]')
+    parser.add_argument('start_bank', nargs='?', default='1', help='ROM bank [hex, default 1]')
+    parser.add_argument('--sweep', action='store_true', help='also trace code-like regions not reached from start pc')
+    parser.add_argument('--export', choices=GRAPH_FORMATS, default=None, help='write whole graph instead of summary')
+    parser.add_argument('--top', type=int, default=10, help='length of fan-in and fan-out rankings [default: 10]')
+    parser.add_argument('--output', metavar='FILE', default=None, help='write output to FILE instead of stdout')
+
+    return parser.parse_args(argv)
+
+
+def parse_decode_args(argv):
+    parser = argparse.ArgumentParser(prog='disasm.py decode', description='decode opcodes at address without tracing')
+    parser.add_argument('file_name', help='ROM file')
+    parser.add_argument('address', metavar='ADDRESS[:BANK]', help='first opcode [hex, default bank 1]')
+    parser.add_argument('--count', type=int, default=None,
+                        help='decode N opcodes [default: until unconditional jump or return]')
+    parser.add_argument('--format', choices=OUTPUT_FORMATS, default=FORMAT_TEXT, help='output format')
+
+    args = parser.parse_args(argv)
+
+    try:
+        args.address = parse_code_address(args.address)
+
+    except ValueError:
+        parser.error('invalid address: {}'.format(args.address))
+
+    return args
+
+
+def parse_code_address(text):
+    pc, _, bank = text.partition(':')
+
+    return calculate_internal_address(int(pc, 16), int(bank, 16) if bank else 1)
+
+
+def parse_register(text):
+    registers = {name: register for register, name in HW_REGISTERS.items()}
+
+    return registers[text.upper()] if text.upper() in registers else int(text, 16) & 0xFF
+
+
+def get_source_mnemonic(chunk_index, address):
+    chunk = chunk_index[address]
+    op = chunk[bisect_left(chunk.addresses, address)]
+
+    return get_mnemonic(op.opcode, op.optional_arg)
+
+
+def decode_opcodes(deasm, pc, bank, count=None):
+    # opcodes from pc on in single chunk, count opcodes or up to first unconditional jump or return
+    chunk = Chunk()
+
+    while count is None or len(chunk) < count:
+        op = deasm.get_single_op(pc, bank)
+
+        if op is None:
+            break
+
+        chunk.append(*op)
+        pc += op[3]
+
+        if count is None and get_flow(op[1]) >= FLOW_END_FIRST:
+            break
+
+    return chunk
+
+
+def decode(argv):
+    args = parse_decode_args(argv)
+    address = args.address
+
+    try:
+        deasm = TraceFollower(map_rom(args.file_name))
+
+    except FileNotFoundError:
+        print("ERROR: File not found!")
+        return
+
+    chunk = decode_opcodes(deasm, address & 0xFFFF, address >> 16 if address & 0xFFFF >= 0x4000 else 1, args.count)
+
+    if len(chunk) == 0:
+        print("ERROR: Address outside of ROM!")
+        return
+
+    writer = get_writer(args.format, open_output())
+    writer.write_chunk(chunk)
+    writer.close()
+
+
+def xref(argv):
+    args = parse_xref_args(argv)
+
+    try:
+        program = map_rom(args.file_name)
+
+    except FileNotFoundError:
+        print("ERROR: File not found!")
+        return
+
+    chunk_index, xrefs, _ = load_analysis(program, int(args.start_pc, 16), int(args.start_bank, 16), args.cache)
+    kinds = (XREF_CALL, XREF_JUMP) if args.to is not None else (XREF_READ, XREF_WRITE)
+
+    for kind in kinds if args.kind is None else (args.kind,):
+        for source in xrefs.get_sources(kind, args.target):
+            mnemonic = get_source_mnemonic(chunk_index, source)
+            print('{:<5} {:<20} {}'.format(kind, format_address(source), mnemonic))
+
+
+def search_patterns(argv):
+    from search import search
+
+    args = parse_search_args(argv)
+
+    try:
+        deasm = TraceFollower(map_rom(args.file_name))
+
+    except FileNotFoundError:
+        print("ERROR: File not found!")
+        return
+
+    if args.traced:
+        deasm.trace_all_paths(int(args.start_pc, 16), int(args.start_bank, 16))
+
+    for text, pattern in zip(args.pattern, args.patterns):
+        if len(args.patterns) > 1:
+            print('----- PATTERN {} -----'.format(text))
+
+        for address, ops in search(deasm, pattern, int(args.start_bank, 16), args.traced):
+            print('{:<20} {}'.format(format_address(address), '; '.join(get_mnemonic(*op) for op in ops)))
+
+
+def write_call_graph_summary(graph, stream, top):
+    reachable = graph.get_reachable(graph.entries)
+    stream.write('Routines: {}, calls: {}, reached from entry points: {}\n'
+                 .format(len(graph), len(graph.targets), reachable.count(1)))
+
+    stream.write('----- FAN-IN -----\n')
+
+    for node in graph.rank_fan_in(top):
+        stream.write('{:>6} {}\n'.format(graph.fan_in[node], format_address(graph.nodes[node])))
+
+    stream.write('----- FAN-OUT -----\n')
+
+    for node in graph.rank_fan_out(top):
+        stream.write('{:>6} {}\n'.format(graph.get_fan_out(node), format_address(graph.nodes[node])))
+
+    stream.write('----- RECURSION -----\n')
+
+    for component in graph.get_recursions():
+        stream.write('{}\n'.format(', '.join(format_address(graph.nodes[node]) for node in component)))
+
+    stream.write('----- NOT REACHED FROM ENTRY POINTS -----\n')
+
+    for node in graph.get_unreached():
+        stream.write('{}\n'.format(format_address(graph.nodes[node])))
+
+
+def call_graph(argv):
+    from call_graph import CallGraph, get_graph_writer
+    from sweep import sweep
+
+    args = parse_call_graph_args(argv)
+    start_pc = int(args.start_pc, 16)
+    start_bank = int(args.start_bank, 16)
+
+    try:
+        deasm = TraceFollower(map_rom(args.file_name))
+
+    except FileNotFoundError:
+        print("ERROR: File not found!")
+        return
 
-            deasm = TraceFollower(binary)
-            deasm.trace_all_paths(start_pc, start_bank)
+    deasm.trace_all_paths(start_pc, start_bank)
 
-            for i in deasm.chunk_cache:
-                print_opcodes(deasm.chunk_cache[i])
+    if args.sweep:
+        sweep(deasm, start_bank)
 
-        except FileNotFoundError:
-            print("ERROR: File not found!")
+    graph = CallGraph(deasm.chunk_cache, deasm.xrefs, get_entry_points(start_pc, start_bank))
+    stream = open_output(args.output)
+
+    if args.export is not None:
+        get_graph_writer(args.export)(graph, stream)
+
+    else:
+        write_call_graph_summary(graph, stream, args.top)
+
+    stream.close()
+
+
+def load_analysis(program, start_pc, start_bank, cache_name):
+    # chunk index, cross references and chunk states from cache or tracing, stored in cache if missing
+    from analysis_cache import AnalysisCache, get_rom_hash
+
+    key = (get_rom_hash(program), start_pc, start_bank, 'trace')
+    cache = AnalysisCache(cache_name, ANALYZER_VERSION) if cache_name is not None else None
+
+    if cache is not None:
+        index, xrefs, states = cache.load(*key), cache.load_xrefs(*key), cache.load_states(*key)
+
+        if index is not None and xrefs is not None and states is not None:
+            cache.close()
+            return index, xrefs, states
+
+    deasm = TraceFollower(program)
+    deasm.trace_all_paths(start_pc, start_bank)
+
+    if cache is not None:
+        cache.store(*key, deasm.chunk_cache, deasm.xrefs, deasm.chunk_states)
+        cache.close()
+
+    return deasm.chunk_cache, deasm.xrefs, deasm.chunk_states
+
+
+def diff(argv):
+    from incremental import reanalyze
+
+    args = parse_diff_args(argv)
+    start_pc = int(args.start_pc, 16)
+    start_bank = int(args.start_bank, 16)
+
+    try:
+        old_program = map_rom(args.old_file_name)
+        program = map_rom(args.file_name)
+
+    except FileNotFoundError:
+        print("ERROR: File not found!")
+        return
+
+    old_index, old_xrefs, old_states = load_analysis(old_program, start_pc, start_bank, args.cache)
+    _, result = reanalyze(old_program, old_index, old_xrefs, old_states, program, [(start_pc, start_bank)],
+                          args.verify)
+
+    for sign, chunks in (('+', result.added), ('-', result.removed)):
+        for chunk in chunks:
+            print('{} CHUNK {} ({} opcodes)'.format(sign, format_address(chunk.start), len(chunk)))
+
+    for old_chunk, chunk in result.changed:
+        print('~ CHUNK {} ({} -> {} opcodes)'.format(format_address(chunk.start), len(old_chunk), len(chunk)))
+
+    for sign, notes in (('+', result.added_warnings), ('-', result.removed_warnings)):
+        for address, warning in notes:
+            print('{} WARNING {}: {}'.format(sign, format_address(address), warning))
+
+    print('{} bytes changed, {} chunks traced again, {} kept'.format(
+        sum(end - start for start, end in result.changed_ranges), result.invalidated, result.kept))
+
+    if result.fallback:
+        print('Incremental analysis differs from full trace, changes of full trace are listed')
+
+
+def get_phase(stats, name):
+    return stats.phase(name) if stats is not None else nullcontext()
+
+
+def get_follower(program, stats):
+    if stats is None:
+        return TraceFollower(program)
+
+    from trace_stats import InstrumentedTraceFollower
+
+    return InstrumentedTraceFollower(program, stats=stats)
+
+
+def get_mode(args):
+    # analysis mode stored with cached analyses and checkpoints
+    return 'trace' + ('+vectors' if args.vectors else '') + ('+sweep' if args.sweep else '')
+
+
+def trace(args, program, start_pc, start_bank, stats):
+    deasm = get_follower(program, stats)
+    checkpoint = None
+
+    if args.budget:
+        deasm.budget = TraceBudget(args.max_time, args.max_instructions, args.max_chunks)
+
+    if args.checkpoint is not None:
+        mode = get_mode(args) + ('+log' if args.exec_log is not None else '')
+        from checkpoint import TraceCheckpoint
+
+        checkpoint = TraceCheckpoint(args.checkpoint, program, start_pc, start_bank, mode, args.checkpoint_interval)
+
+        if checkpoint.restore(deasm):
+            print('Resumed from checkpoint: {} chunks, {} paths left'.format(len(deasm.chunk_cache),
+                                                                            len(deasm.visit_queue)), file=sys.stderr)
+
+        deasm.checkpoint = checkpoint
+
+    entries = [(start_pc, start_bank)]
+
+    if args.vectors:  # visit queue pops last entry first, so start pc is traced before vectors
+        entries = get_entry_points(start_pc, start_bank)[::-1]
+
+    if args.jobs is not None:
+        from parallel_tracer import trace_parallel
+
+        with get_phase(stats, 'trace'):
+            trace_parallel(deasm, args.file_name, entries, args.jobs)
 
     else:
-        print("Args: <program name> <start pc [hex, default: 0x100]> <ROM bank [hex, default 1]>")
+        deasm.trace_entries(entries)
+
+    if args.exec_log is not None and deasm.exceeded is None:
+        from execution_log import read_log, seed_from_log, mark_unexecuted
+
+        with get_phase(stats, 'execution log'):  # includes tracing of executed but untraced code
+            log = read_log(args.exec_log, args.exec_log_format)
+            seeded = seed_from_log(deasm, log)
+            unexecuted = mark_unexecuted(deasm.chunk_cache, log)
+
+        print('Execution log: {} records, {} executed addresses, {} new entry points, {} chunks never executed'
+              .format(log.records, len(log), seeded, unexecuted), file=sys.stderr)
+
+    if args.sweep and deasm.exceeded is None:
+        from sweep import sweep
+
+        with get_phase(stats, 'sweep'):  # includes tracing of seeded entry points
+            sweep(deasm, start_bank)
+
+    if deasm.exceeded is not None:
+        print('Tracing stopped by {} limit, partial results: {} chunks, {} paths left'
+              .format(deasm.exceeded, len(deasm.chunk_cache), len(deasm.visit_queue)), file=sys.stderr)
+
+        if checkpoint is not None:
+            checkpoint.save(deasm)
+
+    elif checkpoint is not None:
+        checkpoint.remove()
+
+    return deasm
+
+
+def disassemble(args, start_pc, start_bank, stats):
+    program = map_rom(args.file_name)
+
+    if args.stream:
+        chunks = get_follower(program, stats).iter_chunks(start_pc, start_bank)
+
+    elif args.cache is not None:
+        from analysis_cache import AnalysisCache, get_rom_hash
+
+        cache = AnalysisCache(args.cache, ANALYZER_VERSION)
+        key = (get_rom_hash(program), start_pc, start_bank, get_mode(args))
+
+        with get_phase(stats, 'cache load'):
+            chunk_index = cache.load(*key)
+
+        if chunk_index is None:
+            deasm = trace(args, program, start_pc, start_bank, stats)
+            chunk_index = deasm.chunk_cache
+
+            if deasm.exceeded is None:  # partial results aren't cached
+                with get_phase(stats, 'cache store'):
+                    cache.store(*key, chunk_index, deasm.xrefs, deasm.chunk_states)
+
+        cache.close()
+        chunks = chunk_index.values()
+
+    else:
+        chunks = trace(args, program, start_pc, start_bank, stats).chunk_cache.values()
+
+    stream = open_output(args.output)
+    writer = get_writer(args.format, stream)
+
+    with get_phase(stats, 'trace and output' if args.stream else 'output'):
+        for chunk in chunks:
+            writer.write_chunk(chunk)
+
+            if args.stream:  # don't keep finished chunks in buffer
+                stream.flush()
+
+        writer.close()
+
+
+def main():
+    if sys.argv[1:2] == ['decode']:
+        decode(sys.argv[2:])
+        return
+
+    if sys.argv[1:2] == ['xref']:
+        xref(sys.argv[2:])
+        return
+
+    if sys.argv[1:2] == ['diff']:
+        diff(sys.argv[2:])
+        return
+
+    if sys.argv[1:2] == ['callgraph']:
+        call_graph(sys.argv[2:])
+        return
+
+    if sys.argv[1:2] == ['search']:
+        search_patterns(sys.argv[2:])
+        return
+
+    args = parse_args()
+    start_pc = int(args.start_pc, 16)
+    start_bank = int(args.start_bank, 16)
+    stats = None
+    profiler = None
+
+    if args.stats or args.profile is not None:
+        from trace_stats import TraceStats
+
+        stats = TraceStats()
+
+    if args.profile is not None:
+        import cProfile
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    try:
+        disassemble(args, start_pc, start_bank, stats)
+
+    except FileNotFoundError:
+        print("ERROR: File not found!")
+
+    if profiler is not None:
+        profiler.disable()
+        profiler.dump_stats(args.profile)
+
+    if stats is not None:
+        print('\n'.join(stats.get_lines()), file=sys.stderr)
 
 
 if __name__ == "__main__":
-    colorama.init(autoreset=True, convert=False, strip=False)  # remove last 2 args if not using PyCharm
-    main()
-    colorama.deinit()
+    color = sys.stdout.isatty()  # colorama is needed only for colored output to terminal
 
+    if color:
+        import colorama
+        colorama.init(autoreset=True, convert=False, strip=False)  # remove last 2 args if not using PyCharm
 
+    main()
 
+    if color:
+        colorama.deinit()
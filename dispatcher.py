@@ -1,4 +1,12 @@
-A_MODS = {0xA, 0x1A, 0x2A, 0x3A, 0xF0, 0xF1, 0xF2, 0xC6, 0xD6, 0xE6, 0xF6, 0xFA, 0xCE, 0xDE, 0xEE} | \
+# register effect flags
+MOD_A = 1
+MOD_HL = 2
+LOAD_A = 4
+ZERO_A = 8
+LOAD_HL = 16
+
+A_MODS = {0x07, 0xA, 0x0F, 0x17, 0x1A, 0x1F, 0x27, 0x2A, 0x2F, 0x3A, 0x3C, 0x3D, 0xF0, 0xF1, 0xF2, 0xC6, 0xD6, 0xE6,
+          0xF6, 0xFA, 0xCE, 0xDE, 0xEE} | \
          set(range(0x77, 0xB8)) | \
          set([0xCB07 + x*0x10 for x in range(0, 0x10)]) | \
          set([0xCB0F + x*0x10 for x in range(0, 0x10)])
@@ -11,54 +19,132 @@ HL_MODS = set(range(0x60, 0x70)) | \
           {0x09, 0x19, 0x29, 0x39, 0xE1, 0xF8}
 
 
-def mbc_mapper(bank_num):
-    if bank_num & 0x1F == 0:
-        bank_num |= 0x1
+# memory bank controllers
+MBC_NONE = 'none'
+MBC1 = 'mbc1'
+MBC2 = 'mbc2'
+MBC3 = 'mbc3'
+MBC5 = 'mbc5'
 
-    return bank_num
+# cartridge type (header byte 0x147) -> memory bank controller, unknown types are handled like MBC1
+CARTRIDGE_TYPES = {0x00: MBC_NONE, 0x08: MBC_NONE, 0x09: MBC_NONE,
+                   0x01: MBC1, 0x02: MBC1, 0x03: MBC1,
+                   0x05: MBC2, 0x06: MBC2,
+                   0x0F: MBC3, 0x10: MBC3, 0x11: MBC3, 0x12: MBC3, 0x13: MBC3,
+                   0x19: MBC5, 0x1A: MBC5, 0x1B: MBC5, 0x1C: MBC5, 0x1D: MBC5, 0x1E: MBC5}
 
+# ROM size (header byte 0x148) -> number of 16 KiB banks
+ROM_SIZES = dict([(code, 2 << code) for code in range(0x09)] + [(0x52, 72), (0x53, 80), (0x54, 96)])
 
-def mbc5_mapper(bank_num):
-    return bank_num
 
+def mbc1_mapper(address, bank_num, bank):
+    return bank_num & 0x1F or 1
 
-def get_new_bank(opcode_list):
-    for op in reversed(opcode_list):
-        if op.opcode == 0x3E:  # if opcode == 'LD A,(0x0 ~ 0xFF)'
-            return mbc_mapper(op.optional_arg)
 
-        elif op.opcode == 0xAF:  # opcode == XOR A,A
-            return mbc_mapper(0)
+def mbc2_mapper(address, bank_num, bank):
+    return bank_num & 0x0F or 1
 
-        elif op.opcode in A_MODS:  # register A got modified, abort dispatching
-            op.warning = 'Bank resolving aborted here'
-            break
 
-    raise Exception('Could not resolve new bank adress!')
+def mbc3_mapper(address, bank_num, bank):
+    return bank_num & 0x7F or 1
+
+
+def mbc5_mapper(address, bank_num, bank):
+    if address < 0x3000:  # low 8 bits, bank 0 can be selected
+        return (bank & 0x100) | bank_num
+
+    return (bank & 0xFF) | ((bank_num & 1) << 8)
+
+
+MAPPERS = {MBC1: mbc1_mapper, MBC2: mbc2_mapper, MBC3: mbc3_mapper, MBC5: mbc5_mapper}
+
+
+class Cartridge:
+    # memory bank controller and bank count taken from cartridge header
+    def __init__(self, program):
+        file_banks = max(2, (len(program) + 0x3FFF) // 0x4000)
+
+        if len(program) > 0x148:
+            self.mbc = CARTRIDGE_TYPES.get(program[0x147], MBC1)
+            self.bank_count = min(ROM_SIZES.get(program[0x148], file_banks), file_banks)
+
+        else:
+            self.mbc = MBC1
+            self.bank_count = file_banks
+
+        self.mapper = MAPPERS.get(self.mbc)
+        self.bank_mask = 1
+
+        while self.bank_mask < self.bank_count:  # unconnected bank number bits are ignored
+            self.bank_mask <<= 1
+
+        self.bank_mask -= 1
 
+    def is_bank_write(self, address):
+        if self.mbc == MBC_NONE:
+            return False
 
-def get_hl_mod(opcode_list):
-    hval = None
-    lval = None
+        elif self.mbc == MBC2:  # 0x0000 ~ 0x3FFF with address bit 8 set
+            return address < 0x4000 and address & 0x100 != 0
 
-    for op in reversed(opcode_list):
-        if op.opcode == 0x21:  # if opcode == 'LD HL,(0x0000 ~ 0xFFFF)'
-            return None, op.optional_arg
+        return 0x2000 <= address <= 0x3FFF
 
-        elif op.opcode == 0x26 and hval is not None:  # if opcode == 'LD H,(0x0 ~ 0xFF)'
-            hval = op.optional_arg
+    def map_bank(self, address, bank_num, bank):
+        new_bank = self.mapper(address, bank_num, bank) & self.bank_mask
 
-            if lval is not None:
-                return None, (hval << 8) | lval
+        if new_bank >= self.bank_count:
+            raise Exception('Bank number out of ROM!')
+
+        return new_bank
+
+
+class RegisterState:
+    # forward tracked A and HL values of chunk, None if value is unknown
+    def __init__(self, chunk):
+        self.chunk = chunk
+        self.a = None
+        self.a_mod = None  # index of opcode which made A unknown
+        self.hl = None
+        self.hl_mod = None  # index of opcode which made HL unknown
+
+    def update(self, index, optional_arg, mods):
+        if mods & LOAD_A:  # LD A,(0x0 ~ 0xFF)
+            self.a = optional_arg
+            self.a_mod = None
+
+        elif mods & ZERO_A:  # XOR A,A
+            self.a = 0
+            self.a_mod = None
+
+        elif mods & MOD_A:
+            self.a = None
+            self.a_mod = index
+
+        if mods & LOAD_HL:  # LD HL,(0x0000 ~ 0xFFFF)
+            self.hl = optional_arg
+            self.hl_mod = None
+
+        elif mods & MOD_HL:
+            self.hl = None
+            self.hl_mod = index
+
+
+def get_new_bank(reg_state, cartridge, address, bank):
+    # bank selected by LD (address),A
+    if reg_state.a is not None:
+        return cartridge.map_bank(address, reg_state.a, bank)
+
+    if reg_state.a_mod is not None:  # register A got modified, abort dispatching
+        reg_state.chunk[reg_state.a_mod].warning = 'Bank resolving aborted here'
+
+    raise Exception('Could not resolve new bank adress!')
 
-        elif op.opcode == 0x2E and lval is not None:  # if opcode == 'LD L,(0x0 ~ 0xFF)'
-            lval = op.optional_arg
 
-            if hval is not None:
-                return None, (hval << 8) | lval
+def get_hl_mod(reg_state):
+    if reg_state.hl is not None:
+        return None, reg_state.hl
 
-        elif op.opcode in HL_MODS:
-            op.warning = 'HL resolving aborted here'
-            break
+    if reg_state.hl_mod is not None:
+        reg_state.chunk[reg_state.hl_mod].warning = 'HL resolving aborted here'
 
     return 'Could not resolve HL value!', None
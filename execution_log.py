@@ -0,0 +1,175 @@
+import re
+import sys
+from array import array
+from helpers import calculate_internal_address
+
+LOG_TEXT = 'text'  # line per executed instruction, BANK:PC in hex (01:4A2F), rest of line is ignored
+LOG_BINARY = 'binary'  # 4 bytes little endian per executed instruction, (bank << 16) | pc
+LOG_FORMATS = (LOG_TEXT, LOG_BINARY)
+LOG_BLOCK_SIZE = 1 << 20
+
+_TEXT_RECORD = re.compile(rb'\s*([0-9A-Fa-f]{1,4}):([0-9A-Fa-f]{1,4})')
+
+
+def get_log_format(file_name):
+    return LOG_BINARY if file_name.lower().endswith('.bin') else LOG_TEXT
+
+
+class ExecutionLog:
+    # per bank bitsets of executed addresses 0x0000 ~ 0x7FFF, memory doesn't depend on log length
+    def __init__(self):
+        self.banks = {}  # bank -> bytearray, bit per address
+        self.records = 0  # log records read, duplicates included
+        self.outside = 0  # unique pc values outside of ROM (RAM, HRAM), bank is ignored there
+        self.outside_bits = bytearray(0x1000)  # bit per address 0x8000 ~ 0xFFFF
+
+    def add(self, pc, bank):
+        if pc >= 0x8000:
+            offset = pc - 0x8000
+
+            if not self.outside_bits[offset >> 3] & (1 << (offset & 7)):
+                self.outside_bits[offset >> 3] |= 1 << (offset & 7)
+                self.outside += 1
+
+            return
+
+        bits = self.banks.get(bank)
+
+        if bits is None:
+            bits = self.banks[bank] = bytearray(0x1000)
+
+        bits[pc >> 3] |= 1 << (pc & 7)
+
+    def is_executed(self, pc, bank):
+        # code in bank 0 is executed with any bank
+        banks = self.banks.values() if pc < 0x4000 else [self.banks.get(bank)]
+
+        return any(bits is not None and bits[pc >> 3] & (1 << (pc & 7)) for bits in banks)
+
+    def __len__(self):
+        # number of executed addresses
+        return sum(sum(bin(byte).count('1') for byte in self.get_bits(bank)) for bank in self.get_banks())
+
+    def get_banks(self):
+        # bank 0 stands for addresses 0x0000 ~ 0x3FFF executed in any bank
+        return sorted(set(self.banks) | ({0} if self.banks else set()))
+
+    def get_bits(self, bank):
+        # bitset of bank 0x0000 ~ 0x3FFF (bank 0) or 0x4000 ~ 0x7FFF
+        if bank == 0:
+            fixed = 0
+
+            for bits in self.banks.values():
+                fixed |= int.from_bytes(bits[:0x800], 'little')
+
+            return fixed.to_bytes(0x800, 'little')
+
+        bits = self.banks.get(bank)
+
+        return bits[0x800:] if bits is not None else bytes(0x800)
+
+    def iter_addresses(self):
+        # executed (pc, bank) in address order, code in bank 0 gets first bank it was executed with
+        for bank in self.get_banks():
+            bits = self.get_bits(bank)
+            base = 0 if bank == 0 else 0x4000
+
+            for index in range(0x800):
+                byte = bits[index]
+
+                for bit in range(8) if byte else ():
+                    if byte & (1 << bit):
+                        pc = base + index * 8 + bit
+                        yield pc, bank if bank > 0 else self.get_fixed_bank(pc)
+
+    def get_fixed_bank(self, pc):
+        for bank in sorted(self.banks):
+            if self.banks[bank][pc >> 3] & (1 << (pc & 7)):
+                return bank
+
+        return 1
+
+    def read(self, stream, log_format=LOG_TEXT):
+        # read log in blocks, records are deduplicated per block before they are decoded
+        rest = b''
+
+        while True:
+            block = stream.read(LOG_BLOCK_SIZE)
+
+            if not block:
+                break
+
+            block = rest + block
+
+            if log_format == LOG_BINARY:
+                usable = len(block) - len(block) % 4
+                rest = block[usable:]
+                self.add_records(block[:usable])
+
+            else:
+                lines = block.split(b'\n')
+                rest = lines.pop()
+                self.add_lines(lines)
+
+        if rest and log_format == LOG_TEXT:
+            self.add_lines([rest])
+
+    def add_records(self, data):
+        records = array('I')
+        records.frombytes(data)
+
+        if sys.byteorder == 'big':
+            records.byteswap()
+
+        self.records += len(records)
+
+        for record in set(records):
+            self.add(record & 0xFFFF, record >> 16)
+
+    def add_lines(self, lines):
+        self.records += len(lines)
+
+        for line in set(lines):
+            match = _TEXT_RECORD.match(line)
+
+            if match is not None:
+                self.add(int(match[2], 16), int(match[1], 16))
+
+
+def read_log(file_name, log_format=None):
+    log = ExecutionLog()
+
+    with open(file_name, 'rb') as stream:
+        log.read(stream, get_log_format(file_name) if log_format is None else log_format)
+
+    return log
+
+
+def seed_from_log(follower, log):
+    # trace executed addresses not covered by traced chunks, returns number of new entry points
+    seeded = 0
+
+    for pc, bank in log.iter_addresses():
+        if calculate_internal_address(pc, bank) in follower.chunk_cache:
+            continue
+
+        follower.follow_entries([(pc, bank)])
+        seeded += 1
+
+    follower.collect_register_accesses()
+
+    return seeded
+
+
+def mark_unexecuted(index, log):
+    # first opcode of chunks without any executed opcode gets info, returns number of such chunks
+    count = 0
+
+    for chunk in index.values():
+        bank = chunk.start >> 16
+
+        if not any(log.is_executed(address & 0xFFFF, bank) for address in chunk.addresses):
+            chunk.infos.setdefault(0, 'Never executed in log')
+            count += 1
+
+    return count
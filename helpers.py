@@ -1,3 +1,64 @@
+import mmap
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import deque
+
+# visit queue orders
+ORDER_DFS = 'dfs'
+ORDER_BFS = 'bfs'
+ORDER_BANK = 'bank'  # depth first, but drain current bank before switching to another one
+
+INDEX_BLOCK = 512  # chunks per ChunkIndex block
+
+
+def calculate_internal_address(pc, bank):
+    if pc < 0x4000:
+        return pc
+
+    else:
+        return (bank << 16) | pc
+
+
+def get_rom_offset(address):
+    # file offset of internal address
+    pc = address & 0xFFFF
+
+    return pc if pc < 0x4000 else (address >> 16) * 0x4000 + pc - 0x4000
+
+
+def get_pc_bank(offset, default_bank):
+    # pc and bank of file offset, code in bank 0 gets default bank as current bank
+    bank = offset // 0x4000
+
+    return (offset, default_bank) if bank == 0 else (0x4000 | (offset & 0x3FFF), bank)
+
+
+def is_inside(chunk, address):
+    # address is beginning of opcode in chunk
+    if len(chunk) == 0 or not chunk.start <= address <= chunk.end:
+        return False
+
+    index = bisect_left(chunk.addresses, address)
+
+    return index < len(chunk) and chunk.addresses[index] == address
+
+
+def is_traced(chunk_index, address):
+    # address is beginning of traced opcode
+    chunk = chunk_index.get(address)
+
+    return chunk is not None and is_inside(chunk, address)
+
+
+def map_rom(file_name):
+    # read-only view of ROM file, pages are shared between processes analyzing the same file
+    with open(file_name, 'rb') as file:
+        try:
+            return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        except ValueError:  # empty file can't be mapped
+            return b''
+
 
 class Rang:
     start = 0
@@ -7,47 +68,390 @@ class Rang:
         self.start = start
         self.end = end
 
-    def __eq__(self, other):
-        return self.start <= other <= self.end
+    def overlaps(self, other_rang):
+        return self.start <= other_rang.end and self.end >= other_rang.start
 
-    def __lt__(self, other):
-        return self.start < other
 
-    def __le__(self, other):
-        return self.start <= other
+class Opcode:
+    # lightweight view of single opcode stored in chunk
+    __slots__ = ('chunk', 'index')
 
-    def __gt__(self, other):
-        return self.end > other
+    def __init__(self, chunk, index):
+        self.chunk = chunk
+        self.index = index
 
-    def __ge__(self, other):
-        return self.end >= other
+    @property
+    def address(self):
+        return self.chunk.addresses[self.index]
 
-    def overlaps(self, other_rang):
-        return self.start <= other_rang.end and self.end >= other_rang.start
+    @property
+    def opcode(self):
+        return self.chunk.codes[self.index]
 
+    @property
+    def optional_arg(self):
+        if self.chunk.lengths[self.index] == 1 or self.chunk.codes[self.index] > 0xFF:
+            return None
 
-class Opcode:
-    address = 0
-    opcode = 0
-    optional_arg = 0
-    opcode_len = 0
-    warning = None
-    info = None
+        return self.chunk.args[self.index]
 
-    def __init__(self, address, opcode, optional_arg, opcode_len):
-        self.address = address
-        self.opcode = opcode
-        self.optional_arg = optional_arg
-        self.opcode_len = opcode_len
+    @property
+    def opcode_len(self):
+        return self.chunk.lengths[self.index]
 
-    def __eq__(self, other):
-        return self.address == other
+    @property
+    def warning(self):
+        return self.chunk.warnings.get(self.index)
 
+    @warning.setter
+    def warning(self, value):
+        self.chunk.warnings[self.index] = value
 
-class Chunk:
-    opcodes = []
-    end_warning = None
+    @property
+    def info(self):
+        return self.chunk.infos.get(self.index)
+
+    @info.setter
+    def info(self, value):
+        self.chunk.infos[self.index] = value
 
-    def __init__(self, opcodes, warning):
-        self.opcodes = opcodes
+
+class Chunk:
+    # opcodes in parallel arrays, after split both chunks are memoryview slices of the same arrays,
+    # chunk copies them only when it has to grow
+    def __init__(self, warning=None):
+        self.addresses = array('I')
+        self.codes = array('H')
+        self.args = array('H')  # 0 for opcodes without argument
+        self.lengths = array('B')
+        self.warnings = {}  # opcode index -> warning
+        self.infos = {}  # opcode index -> info
         self.end_warning = warning
+
+    def __len__(self):
+        return len(self.addresses)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self.addresses)
+
+        return Opcode(self, index)
+
+    def __iter__(self):
+        return map(Opcode, [self] * len(self.addresses), range(len(self.addresses)))
+
+    def __getstate__(self):
+        # memoryviews can't be pickled, pickled chunk gets its own arrays
+        state = self.__dict__.copy()
+
+        if self.is_view():
+            for name in ('addresses', 'codes', 'args', 'lengths'):
+                state[name] = array(state[name].format, state[name])
+
+        return state
+
+    @property
+    def start(self):
+        return self.addresses[0]
+
+    @property
+    def end(self):
+        return self.addresses[-1] + self.lengths[-1] - 1
+
+    def is_view(self):
+        return isinstance(self.addresses, memoryview)
+
+    def own(self):
+        # copy shared arrays before chunk grows
+        if self.is_view():
+            self.addresses = array('I', self.addresses)
+            self.codes = array('H', self.codes)
+            self.args = array('H', self.args)
+            self.lengths = array('B', self.lengths)
+
+    def append(self, address, opcode, optional_arg, opcode_len):
+        self.own()
+        self.addresses.append(address)
+        self.codes.append(opcode)
+        self.args.append(optional_arg or 0)
+        self.lengths.append(opcode_len)
+
+    def truncate(self, index):
+        # drop opcodes [index:]
+        if self.is_view():
+            self.addresses = self.addresses[:index]
+            self.codes = self.codes[:index]
+            self.args = self.args[:index]
+            self.lengths = self.lengths[:index]
+
+        else:
+            del self.addresses[index:]
+            del self.codes[index:]
+            del self.args[index:]
+            del self.lengths[index:]
+
+        self.warnings = {i: warning for i, warning in self.warnings.items() if i < index}
+        self.infos = {i: info for i, info in self.infos.items() if i < index}
+
+    def split(self, index):
+        # move opcodes [index:] to new chunk, end warning goes with them, opcodes are not copied
+        tail = Chunk(self.end_warning)
+        views = [memoryview(values) for values in (self.addresses, self.codes, self.args, self.lengths)]
+        tail.addresses, tail.codes, tail.args, tail.lengths = [view[index:] for view in views]
+        tail.warnings = {i - index: warning for i, warning in self.warnings.items() if i >= index}
+        tail.infos = {i - index: info for i, info in self.infos.items() if i >= index}
+
+        self.addresses, self.codes, self.args, self.lengths = [view[:index] for view in views]
+        self.warnings = {i: warning for i, warning in self.warnings.items() if i < index}
+        self.infos = {i: info for i, info in self.infos.items() if i < index}
+        self.end_warning = None
+
+        return tail
+
+    def extend(self, other, start=0, stop=None):
+        # append opcodes [start:stop] of other chunk
+        stop = len(other) if stop is None else stop
+        offset = len(self) - start
+
+        self.own()
+        self.addresses.extend(other.addresses[start:stop])
+        self.codes.extend(other.codes[start:stop])
+        self.args.extend(other.args[start:stop])
+        self.lengths.extend(other.lengths[start:stop])
+
+        for index, warning in other.warnings.items():
+            if start <= index < stop:
+                self.warnings[index + offset] = warning
+
+        for index, info in other.infos.items():
+            if start <= index < stop:
+                self.infos[index + offset] = info
+
+
+class FunctionSummary:
+    __slots__ = ('returns', 'stack_effect', 'bank')
+
+    def __init__(self, returns, stack_effect, bank):
+        self.returns = returns  # True, False or None if unknown
+        self.stack_effect = stack_effect  # stack balance at function exits, None if unknown or not the same
+        self.bank = bank  # ROM bank at function exits, None if unknown or not the same
+
+
+UNKNOWN_SUMMARY = FunctionSummary(None, None, None)
+
+
+class ChunkIndex:
+    # chunks sorted by start in blocks of parallel lists, insert and split shift only one block, block is halved
+    # when it grows over 2 * INDEX_BLOCK chunks, positional lists (starts, ends, chunks) are joined from blocks
+    # on first use after change, so tracer uses address lookups only
+    def __init__(self):
+        self.firsts = []  # start of first chunk of every block
+        self.start_blocks = []
+        self.end_blocks = []
+        self.chunk_blocks = []
+        self.size = 0
+        self.joined = None  # (starts, ends, chunks)
+
+    def get(self, address):
+        # chunk covering address, None if address is not covered
+        block = bisect_right(self.firsts, address) - 1
+
+        if block >= 0:
+            pos = bisect_right(self.start_blocks[block], address) - 1
+
+            if self.end_blocks[block][pos] >= address:
+                return self.chunk_blocks[block][pos]
+
+        return None
+
+    def __contains__(self, address):
+        return self.get(address) is not None
+
+    def __getitem__(self, address):
+        chunk = self.get(address)
+
+        if chunk is None:
+            raise KeyError(address)
+
+        return chunk
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        return iter(self.starts)
+
+    def next_start(self, address):
+        # beginning of first chunk at or after address, None if there is no such chunk
+        block = max(bisect_right(self.firsts, address) - 1, 0)
+
+        if block < len(self.firsts):
+            starts = self.start_blocks[block]
+            pos = bisect_left(starts, address)
+
+            if pos < len(starts):
+                return starts[pos]
+
+            if block + 1 < len(self.firsts):
+                return self.firsts[block + 1]
+
+        return None
+
+    def insert(self, chunk):
+        if not self.firsts:
+            self.firsts.append(chunk.start)
+            self.start_blocks.append([])
+            self.end_blocks.append([])
+            self.chunk_blocks.append([])
+
+        block = max(bisect_right(self.firsts, chunk.start) - 1, 0)
+        self._insert_at(block, bisect_right(self.start_blocks[block], chunk.start), chunk)
+
+    def _insert_at(self, block, pos, chunk):
+        starts = self.start_blocks[block]
+        starts.insert(pos, chunk.start)
+        self.end_blocks[block].insert(pos, chunk.end)
+        self.chunk_blocks[block].insert(pos, chunk)
+        self.firsts[block] = starts[0]
+        self.size += 1
+        self.joined = None
+
+        if len(starts) > 2 * INDEX_BLOCK:
+            for blocks in (self.start_blocks, self.end_blocks, self.chunk_blocks):
+                blocks.insert(block + 1, blocks[block][INDEX_BLOCK:])
+                del blocks[block][INDEX_BLOCK:]
+
+            self.firsts.insert(block + 1, self.start_blocks[block + 1][0])
+
+    def split(self, address):
+        # split chunk covering address so that address starts new chunk, returns new chunk,
+        # None if address isn't opcode boundary in the middle of chunk
+        block = bisect_right(self.firsts, address) - 1
+
+        if block < 0:
+            return None
+
+        pos = bisect_right(self.start_blocks[block], address) - 1
+        chunk = self.chunk_blocks[block][pos]
+        index = bisect_left(chunk.addresses, address)
+
+        if index == 0 or index == len(chunk) or chunk.addresses[index] != address:
+            return None
+
+        tail = chunk.split(index)
+        self.end_blocks[block][pos] = chunk.end
+        self._insert_at(block, pos + 1, tail)
+
+        return tail
+
+    def remove(self, address):
+        # remove chunk covering address
+        block = bisect_right(self.firsts, address) - 1
+        pos = bisect_right(self.start_blocks[block], address) - 1 if block >= 0 else -1
+
+        if pos < 0 or self.end_blocks[block][pos] < address:
+            raise KeyError(address)
+
+        for blocks in (self.start_blocks, self.end_blocks, self.chunk_blocks):
+            del blocks[block][pos]
+
+        if self.start_blocks[block]:
+            self.firsts[block] = self.start_blocks[block][0]
+
+        else:
+            for blocks in (self.firsts, self.start_blocks, self.end_blocks, self.chunk_blocks):
+                del blocks[block]
+
+        self.size -= 1
+        self.joined = None
+
+    def join(self):
+        if self.joined is None:
+            self.joined = ([start for starts in self.start_blocks for start in starts],
+                           [end for ends in self.end_blocks for end in ends],
+                           [chunk for chunks in self.chunk_blocks for chunk in chunks])
+
+        return self.joined
+
+    @property
+    def starts(self):
+        return self.join()[0]
+
+    @property
+    def ends(self):
+        return self.join()[1]
+
+    @property
+    def chunks(self):
+        return self.join()[2]
+
+    def find(self, address):
+        # position of chunk covering address in starts, ends and chunks, -1 if address is not covered
+        starts, ends, _ = self.join()
+        pos = bisect_right(starts, address) - 1
+
+        if pos >= 0 and ends[pos] >= address:
+            return pos
+
+        return -1
+
+    def values(self):
+        return iter(self.chunks)
+
+    def items(self):
+        return zip(map(Rang, self.starts, self.ends), self.chunks)
+
+
+class VisitQueue:
+    def __init__(self, order=ORDER_DFS):
+        if order not in (ORDER_DFS, ORDER_BFS, ORDER_BANK):
+            raise ValueError('Unknown visit order: {}'.format(order))
+
+        self.order = order
+        self.pending = {}  # bank -> deque of (pc, bank, stack_balance)
+        self.current_bank = 0
+        self.seen = set()  # (internal address, stack balance) of pending entries, popped entry can be queued again
+        self.size = 0
+
+        # counters
+        self.pushed = 0
+        self.duplicates = 0
+        self.peak_depth = 0
+
+    def __len__(self):
+        return self.size
+
+    def append(self, entry):
+        pc, bank, stack_balance = entry
+        key = (calculate_internal_address(pc, bank), stack_balance)
+
+        if key in self.seen:
+            self.duplicates += 1
+            return
+
+        self.seen.add(key)
+        queue_bank = 0 if pc < 0x4000 or self.order != ORDER_BANK else bank
+
+        if queue_bank not in self.pending:
+            self.pending[queue_bank] = deque()
+
+        self.pending[queue_bank].append(entry)
+        self.pushed += 1
+        self.size += 1
+        self.peak_depth = max(self.peak_depth, self.size)
+
+    def pop(self):
+        if self.size == 0:
+            raise IndexError('pop from empty visit queue')
+
+        pending = self.pending.get(self.current_bank)
+
+        if not pending:
+            self.current_bank = min(bank for bank in self.pending if self.pending[bank])
+            pending = self.pending[self.current_bank]
+
+        self.size -= 1
+        entry = pending.popleft() if self.order == ORDER_BFS else pending.pop()
+        self.seen.discard((calculate_internal_address(entry[0], entry[1]), entry[2]))
+
+        return entry
@@ -0,0 +1,590 @@
+import hashlib
+from bisect import bisect_left, bisect_right
+from helpers import *
+from decoder import *
+from trace_follower import TraceFollower, u8_correction
+from xrefs import XREF_CALL, XREF_JUMP
+
+MIN_COMPARE = 64  # byte ranges up to this size are compared byte by byte
+
+
+def get_bank_hashes(program):
+    view = memoryview(program)
+
+    return [hashlib.sha1(view[i:i + 0x4000]).digest() for i in range(0, len(view), 0x4000)]
+
+
+def _find_differences(old_program, new_program, start, end, ranges):
+    # append differing byte runs of [start, end) to ranges, equal halves are skipped
+    if old_program[start:end] == new_program[start:end]:
+        return
+
+    if end - start > MIN_COMPARE:
+        middle = (start + end) // 2
+        _find_differences(old_program, new_program, start, middle, ranges)
+        _find_differences(old_program, new_program, middle, end, ranges)
+        return
+
+    for offset in range(start, end):
+        if old_program[offset] == new_program[offset]:
+            continue
+
+        if ranges and ranges[-1][1] == offset:
+            ranges[-1] = (ranges[-1][0], offset + 1)
+
+        else:
+            ranges.append((offset, offset + 1))
+
+
+def get_changed_ranges(old_program, new_program):
+    # (start, end) file offsets of changed bytes, end is exclusive, ranges don't cross bank boundaries,
+    # banks with equal hashes are skipped, bytes present in only one ROM are changed
+    common = min(len(old_program), len(new_program))
+    ranges = []
+
+    for bank, (old_hash, new_hash) in enumerate(zip(get_bank_hashes(old_program), get_bank_hashes(new_program))):
+        if old_hash != new_hash:
+            _find_differences(old_program, new_program, bank * 0x4000, min(bank * 0x4000 + 0x4000, common), ranges)
+
+    size = max(len(old_program), len(new_program))
+    ranges.extend((start, min((start // 0x4000 + 1) * 0x4000, size)) for start in
+                  [common] + list(range((common // 0x4000 + 1) * 0x4000, size, 0x4000)) if start < size)
+
+    return ranges
+
+
+def get_address_ranges(start, end):
+    # internal address ranges of file offsets [start, end) in one bank, bank 0 can be mapped to 0x4000 by MBC5
+    bank = start // 0x4000
+    pc = start & 0x3FFF
+    length = end - start
+
+    if bank == 0:
+        return [(pc, pc + length), (0x4000 + pc, 0x4000 + pc + length)]
+
+    return [((bank << 16) | (0x4000 + pc), (bank << 16) | (0x4000 + pc + length))]
+
+
+def get_target(chunk, index, flow):
+    # pc of jump or call target of opcode at index
+    if flow == FLOW_JR_COND or flow == FLOW_JR:
+        return (chunk.addresses[index] & 0xFFFF) + chunk.lengths[index] + u8_correction(chunk.args[index])
+
+    elif flow == FLOW_RST:
+        return ((chunk.codes[index] >> 3) & 7) * 0x8
+
+    return chunk.args[index]
+
+
+def get_local_jumps(chunk, states):
+    # (source address, pc, bank, stack balance) of jumps and calls inside chunk as tracer records them, states are
+    # (internal address, bank, stack balance) chunk was traced with
+    local_jumps = []
+    position = 0
+
+    for index, opcode in enumerate(chunk.codes):
+        flow = get_flow(opcode)
+
+        if not FLOW_SPLIT_FIRST <= flow < FLOW_JP_HL:
+            continue
+
+        while position + 1 < len(states) and states[position + 1][0] <= chunk.addresses[index]:
+            position += 1
+
+        _, bank, stack_balance = states[position]
+        pc = get_target(chunk, index, flow)
+
+        if pc < 0x8000 and is_inside(chunk, calculate_internal_address(pc, bank)):
+            is_call = flow == FLOW_CALL or flow == FLOW_RST
+            local_jumps.append((chunk.addresses[index], pc, bank, 0 if is_call else stack_balance))
+
+    return local_jumps
+
+
+def switches_bank(opcode):
+    # code continues in other bank after LD (nn),A or call of function switching bank
+    return opcode == 0xEA or get_flow(opcode) == FLOW_CALL or get_flow(opcode) == FLOW_RST
+
+
+class ChunkGraph:
+    # control transfers between chunks of old analysis, looked up per chunk so that only chunks around changed
+    # bytes are visited, keyed by chunk start, calls and jumps come from cross references recorded by tracer
+    # (with banks tracer used) and chunk opcodes, fall through from chunk ends
+    def __init__(self, program, index, xrefs):
+        self.program = program
+        self.index = index
+        self.xrefs = xrefs
+        self.bank_count = (len(program) + 0x3FFF) // 0x4000
+
+        xrefs.sort()
+
+    def _add(self, transfers, address, is_call):
+        chunk = self.index.get(address)
+
+        if chunk is not None:  # target can be inside chunk
+            transfers.append((chunk.start, is_call))
+
+    def _switches_bank(self, bank, pc):
+        # opcode before pc in bank is LD (nn),A or call, code can switch its own bank there and continue in other one
+        offset = bank * 0x4000 + pc - 0x4000
+
+        return bank * 0x4000 + 3 <= offset <= len(self.program) and \
+            (self.program[offset - 3] == 0xEA or get_flow(self.program[offset - 3]) == FLOW_CALL or
+             get_flow(self.program[offset - 1]) == FLOW_RST)
+
+    def get_successors(self, start):
+        # (target chunk start, is call) of transfers from chunk, nothing if start isn't beginning of chunk
+        chunk = self.index.get(start)
+        successors = []
+
+        if chunk is None or chunk.start != start:
+            return successors
+
+        for index, opcode in enumerate(chunk.codes):
+            flow = get_flow(opcode)
+
+            if flow == FLOW_JP_HL:  # resolved targets are known only from cross references
+                for target in self.xrefs.get_targets(XREF_JUMP, chunk.addresses[index]):
+                    self._add(successors, target, False)
+
+                continue
+
+            elif not FLOW_SPLIT_FIRST <= flow < FLOW_JP_HL:
+                continue
+
+            is_call = flow == FLOW_CALL or flow == FLOW_RST
+            pc = get_target(chunk, index, flow)
+
+            if pc >= 0x8000:
+                continue
+
+            elif pc >= 0x4000 and start & 0xFFFF < 0x4000:  # code in bank 0 doesn't keep bank it was traced with
+                for target in self.xrefs.get_targets(XREF_CALL if is_call else XREF_JUMP, chunk.addresses[index]):
+                    if target & 0xFFFF == pc:
+                        self._add(successors, target, is_call)
+
+            else:
+                self._add(successors, calculate_internal_address(pc, start >> 16), is_call)
+
+        if falls_through(chunk):
+            next_start = chunk.end + 1
+            self._add(successors, next_start, False)
+
+            if next_start & 0xFFFF >= 0x4000 and switches_bank(chunk.codes[-1]):
+                for bank in range(self.bank_count):
+                    if bank != next_start >> 16:
+                        self._add(successors, (bank << 16) | (next_start & 0xFFFF), False)
+
+        return successors
+
+    def get_fall_through_source(self, start):
+        # start of chunk in the same bank continuing in chunk, None if there is no such chunk
+        chunk = self.index.get(start - 1) if start > 0 else None
+
+        return chunk.start if chunk is not None and chunk.end + 1 == start and falls_through(chunk) else None
+
+    def get_predecessors(self, start):
+        # (source chunk start, is call) of transfers to chunk
+        predecessors = []
+
+        for kind in (XREF_CALL, XREF_JUMP):
+            for source in self.xrefs.get_sources(kind, start):
+                self._add(predecessors, source, kind == XREF_CALL)
+
+        source = self.get_fall_through_source(start)
+
+        if source is not None:
+            predecessors.append((source, False))
+
+        pc = start & 0xFFFF
+
+        if pc > 0x4000:
+            for bank in range(self.bank_count):
+                if bank != start >> 16 and self._switches_bank(bank, pc):
+                    chunk = self.index.get((bank << 16) | (pc - 1))
+
+                    if chunk is not None and chunk.end + 1 == (bank << 16) | pc and \
+                            switches_bank(chunk.codes[-1]) and falls_through(chunk):
+                        predecessors.append((chunk.start, False))
+
+        return predecessors
+
+    def get_callers(self, start):
+        # starts of chunks calling chunk
+        callers = []
+
+        for source in self.xrefs.get_callers(start):
+            self._add(callers, source, True)
+
+        return [caller for caller, _ in callers]
+
+    def get_routines(self, starts, seen):
+        # call targets leading to chunks through jumps and fall through (chunks included), their summaries cover
+        # chunks, chunks in seen are skipped and added to it
+        routines = []
+        pending = [start for start in starts if start not in seen]
+        seen.update(pending)
+
+        while pending:
+            start = pending.pop()
+
+            if self.xrefs.get_callers(start):
+                routines.append(start)
+
+            for source, is_call in self.get_predecessors(start):
+                if not is_call and source not in seen:
+                    seen.add(source)
+                    pending.append(source)
+
+        return routines
+
+
+def get_chunks_in(index, ranges):
+    # start -> chunk of chunks overlapping (start, end) internal address ranges, end is exclusive
+    chunks = {}
+
+    for start, end in ranges:
+        chunk = index.get(start)
+        address = chunk.start if chunk is not None else index.next_start(start)
+
+        while address is not None and address < end:
+            chunk = index[address]
+            chunks[address] = chunk
+            address = index.next_start(chunk.end + 1)
+
+    return chunks
+
+
+def get_changed_chunks(index, ranges):
+    # starts of chunks containing changed bytes
+    return set(get_chunks_in(index, [address_range for start, end in ranges
+                                     for address_range in get_address_ranges(start, end)]))
+
+
+def get_summary_banks(ranges, default_bank):
+    # banks summaries of code in bank 0 are compared with, summary with other bank can't change, as its code
+    # doesn't read any changed byte
+    banks = {start // 0x4000 for start, _ in ranges}
+
+    return sorted((banks - {0}) | ({default_bank} if 0 in banks else set()))
+
+
+def same_summary(summary1, summary2):
+    return (summary1.returns, summary1.stack_effect, summary1.bank) == \
+        (summary2.returns, summary2.stack_effect, summary2.bank)
+
+
+def is_decoded_alone(program, index, states, start):
+    # chunk of old analysis is what tracer decodes from its start with state it was traced with up to next chunk,
+    # otherwise it was decoded through following chunks, which were split from it later
+    chunk = index[start]
+    next_chunk = index.get(chunk.end + 1)
+    follower = TraceFollower(program)
+
+    if next_chunk is not None:
+        follower.chunk_cache.insert(next_chunk)
+
+    _, bank, stack_balance = states[start][0]
+
+    return _same_chunk(follower.get_chunk(start & 0xFFFF, bank, stack_balance)[0], chunk)
+
+
+def get_invalid_chunks(graph, changed, old_follower, new_follower, banks, states):
+    # changed chunks, transitive callers of routines whose summary changed (calls depend on summaries of called
+    # code and so do summaries of calling routines) and chunks decoded through any of them
+    invalid = set(changed)
+    pending = list(changed)
+    seen = set()
+
+    while pending:
+        for routine in graph.get_routines([pending.pop()], seen):
+            pc = routine & 0xFFFF
+
+            if all(same_summary(old_follower.get_summary(pc, bank), new_follower.get_summary(pc, bank))
+                   for bank in ([routine >> 16] if pc >= 0x4000 else banks)):
+                continue
+
+            for caller in graph.get_callers(routine):
+                if caller not in invalid:
+                    invalid.add(caller)
+                    pending.append(caller)
+
+    for start in list(invalid):
+        source = graph.get_fall_through_source(start)
+
+        while source is not None and source not in invalid and \
+                not is_decoded_alone(old_follower.program, graph.index, states, source):
+            invalid.add(source)
+            source = graph.get_fall_through_source(source)
+
+    return invalid
+
+
+def _share_chunk(chunk):
+    # new chunk object with views of opcode arrays of chunk, splitting it leaves chunk as it is
+    shared = Chunk(chunk.end_warning)
+    shared.addresses, shared.codes, shared.args, shared.lengths = \
+        [memoryview(values) for values in (chunk.addresses, chunk.codes, chunk.args, chunk.lengths)]
+    shared.warnings = dict(chunk.warnings)
+    shared.infos = dict(chunk.infos)
+
+    return shared
+
+
+class SharedChunkIndex(ChunkIndex):
+    # chunk index of new analysis starting with chunks of old index, chunk objects are shared with old index until
+    # tracer splits them, remembers chunk starts reached by tracer (chunks split by it included), address ranges
+    # of chunks it added or split and number of old chunks which are not shared anymore
+    def __init__(self, old_index):
+        super().__init__()
+        self.old_index = old_index
+        self.firsts = old_index.firsts[:]
+        self.start_blocks = [starts[:] for starts in old_index.start_blocks]
+        self.end_blocks = [ends[:] for ends in old_index.end_blocks]
+        self.chunk_blocks = [chunks[:] for chunks in old_index.chunk_blocks]
+        self.size = old_index.size
+        self.reached = set()
+        self.touched = []  # (start, end) internal address ranges, end is exclusive
+        self.dropped = 0
+
+    def get(self, address):
+        chunk = super().get(address)
+
+        if chunk is not None and chunk.start == address:
+            self.reached.add(address)
+
+        return chunk
+
+    def get_shared(self, address):
+        # chunk of old index beginning at address, None if it was re-traced or split
+        chunk = super().get(address)
+
+        return chunk if chunk is not None and chunk is self.old_index.get(address) else None
+
+    def insert(self, chunk):
+        super().insert(chunk)
+        self.touched.append((chunk.start, chunk.end + 1))
+
+    def split(self, address):
+        block = bisect_right(self.firsts, address) - 1
+
+        if block < 0:
+            return None
+
+        pos = bisect_right(self.start_blocks[block], address) - 1
+        chunk = self.chunk_blocks[block][pos]
+        index = bisect_left(chunk.addresses, address)
+
+        if index == 0 or index == len(chunk) or chunk.addresses[index] != address:  # chunk stays shared
+            return None
+
+        if chunk is self.old_index.get(chunk.start):
+            self.chunk_blocks[block][pos] = _share_chunk(chunk)
+            self.dropped += 1
+
+        tail = super().split(address)
+
+        if tail is not None:
+            self.reached.add(chunk.start)
+            self.touched.append((chunk.start, tail.end + 1))
+
+        return tail
+
+    def remove(self, address):
+        if self.get_shared(address) is not None:
+            self.dropped += 1
+
+        super().remove(address)
+
+
+class IncrementalTraceFollower(TraceFollower):
+    # traces invalid chunks of old analysis into SharedChunkIndex starting with chunk states of old analysis,
+    # jumps inside kept chunks are taken from their opcodes when re-traced code splits them
+    def __init__(self, program_data, old_index, old_states):
+        super().__init__(program_data)
+        self.chunk_cache = SharedChunkIndex(old_index)
+        self.chunk_states = dict(old_states)
+
+    def remove_chunk(self, start):
+        self.chunk_cache.remove(start)
+        del self.chunk_states[start]
+
+    def split_chunk(self, start, address):
+        chunk = self.chunk_cache.get_shared(start)
+
+        if chunk is not None and start not in self.local_jumps:
+            local_jumps = get_local_jumps(chunk, self.chunk_states[start])
+
+            if local_jumps:
+                self.local_jumps[start] = local_jumps
+
+        return super().split_chunk(start, address)
+
+
+def _get_notes(chunks):
+    # (address, warning) of every opcode and end warning
+    notes = set()
+
+    for chunk in chunks:
+        notes.update((chunk.addresses[i], warning) for i, warning in chunk.warnings.items())
+
+        if chunk.end_warning is not None:
+            notes.add((chunk.addresses[-1], chunk.end_warning))
+
+    return notes
+
+
+def _same_chunk(chunk1, chunk2):
+    return chunk1.addresses == chunk2.addresses and chunk1.codes == chunk2.codes and chunk1.args == chunk2.args \
+        and chunk1.lengths == chunk2.lengths and chunk1.warnings == chunk2.warnings \
+        and chunk1.infos == chunk2.infos and chunk1.end_warning == chunk2.end_warning
+
+
+class AnalysisDiff:
+    # old_chunks and new_chunks are start -> chunk of compared parts of analyses
+    def __init__(self, old_chunks, new_chunks):
+        old_notes = _get_notes(old_chunks.values())
+        new_notes = _get_notes(new_chunks.values())
+
+        self.added = [new_chunks[start] for start in sorted(new_chunks) if start not in old_chunks]
+        self.removed = [old_chunks[start] for start in sorted(old_chunks) if start not in new_chunks]
+        self.changed = [(old_chunks[start], new_chunks[start]) for start in sorted(new_chunks)
+                        if start in old_chunks and not _same_chunk(old_chunks[start], new_chunks[start])]
+        self.added_warnings = sorted(new_notes - old_notes)
+        self.removed_warnings = sorted(old_notes - new_notes)
+
+        # filled by reanalyze
+        self.changed_ranges = []
+        self.invalidated = 0
+        self.kept = 0
+        self.fallback = False  # full trace differed from incremental result and replaced it
+
+
+def _same_index(index1, index2):
+    return len(index1) == len(index2) and \
+        all(_same_chunk(chunk1, chunk2) for chunk1, chunk2 in zip(index1.values(), index2.values()))
+
+
+def reanalyze(old_program, old_index, old_xrefs, old_states, new_program, entries, verify=False):
+    # chunk index of new ROM and diff against old analysis, only chunks affected by changed bytes are traced again,
+    # entries are (pc, bank) entry points of old analysis, old states are chunk states tracer kept, chunks of old
+    # index are shared with new one, but they are never modified, with verify new ROM is traced fully too and full
+    # trace replaces incremental result if they differ
+    ranges = get_changed_ranges(old_program, new_program)
+    graph = ChunkGraph(old_program, old_index, old_xrefs)
+    default_bank = entries[0][1] if entries else 1
+    follower = IncrementalTraceFollower(new_program, old_index, old_states)
+    invalid = get_invalid_chunks(graph, get_changed_chunks(old_index, ranges), TraceFollower(old_program), follower,
+                                 get_summary_banks(ranges, default_bank), old_states)
+    entry_addresses = {calculate_internal_address(pc, bank) for pc, bank in entries}
+    index = follower.chunk_cache
+    touched = [(start, old_index[start].end + 1) for start in invalid]
+
+    for start in invalid:
+        follower.remove_chunk(start)
+
+    # invalid chunks entered from kept code or without any known predecessor (entry points, JP (HL) targets),
+    # entered with bank and stack balance they were traced with before
+    for start in sorted(invalid, reverse=True):  # visit queue pops last seed first
+        predecessors = graph.get_predecessors(start)
+
+        if not predecessors or any(source not in invalid for source, _ in predecessors):
+            _, bank, stack_balance = old_states[start][0]
+            follower.visit_queue.append((start & 0xFFFF, bank, stack_balance))
+
+    follower.follow_entries([entry for entry in entries if calculate_internal_address(*entry) in invalid])
+
+    # kept chunks downstream of invalid chunks stay only if entry point, re-traced code or some kept chunk outside
+    # of that region still reaches them, everything reached chunk leads to is reached as well
+    reached = index.reached | entry_addresses
+    region = set()
+    pending = [target for start in invalid for target, _ in graph.get_successors(start)]
+
+    while pending:
+        start = pending.pop()
+
+        if start not in region and start not in invalid and start not in reached:
+            region.add(start)
+            pending.extend(target for target, _ in graph.get_successors(start))
+
+    live = set()
+    pending = [start for start in region
+               if any(source not in region and source not in invalid for source, _ in graph.get_predecessors(start))]
+
+    while pending:
+        start = pending.pop()
+
+        if start in region and start not in live:
+            live.add(start)
+            pending.extend(target for target, _ in graph.get_successors(start))
+
+    removed = region - live
+
+    for start in removed:
+        touched.append((start, old_index[start].end + 1))
+        follower.remove_chunk(start)
+
+    # kept chunk nothing jumps to anymore (jumps from chunks falling through into it are local) is decoded again
+    # with chunk falling through into it, tracer doesn't split chunks there, chunks decoded by follower are
+    # beginnings of paths and already split like full trace splits them
+    follower.xrefs.sort()
+    targeted = set(follower.xrefs.targets[XREF_CALL]) | set(follower.xrefs.targets[XREF_JUMP]) | entry_addresses
+    candidates = {target for start in invalid | removed for target, _ in graph.get_successors(start)}
+    candidates.update(end for _, end in index.touched)
+    merged = {}  # chunk start -> start of chunk falling through into it
+    changed = True
+
+    while changed:
+        changed = False
+
+        for start in sorted(candidates - set(merged)):
+            chunk = index.get(start - 1)
+
+            if start in invalid or start in removed or start in targeted or index.get_shared(start) is None or \
+                    chunk is None or chunk.end + 1 != start or not falls_through(chunk):
+                continue
+
+            if all(source in invalid or source in removed or source in merged or source == start or
+                   source == chunk.start or source in merged.values() for source, _ in graph.get_predecessors(start)):
+                merged[start] = chunk.start
+                candidates.update(target for target, _ in graph.get_successors(start))
+                candidates.add(index[start].end + 1)
+                changed = True
+
+    seeds = []
+
+    for start, source in sorted(merged.items()):
+        touched.append((source, index[start].end + 1))
+        follower.remove_chunk(start)
+        chunk = index.get(source)
+
+        if chunk is None or chunk.start != source:  # merged into chunk before it
+            continue
+
+        _, bank, stack_balance = follower.chunk_states[source][0]
+        follower.remove_chunk(source)
+        seeds.append((source & 0xFFFF, bank, stack_balance))
+
+    for seed in reversed(seeds):  # visit queue pops last seed first
+        follower.visit_queue.append(seed)
+
+    follower.follow_entries([])
+    touched.extend(index.touched)
+    diff = AnalysisDiff(get_chunks_in(old_index, touched), get_chunks_in(index, touched))
+    diff.changed_ranges = ranges
+    diff.invalidated = len(invalid)
+    diff.kept = len(old_index) - index.dropped
+
+    if verify:
+        full = TraceFollower(new_program)
+        full.follow_entries(entries)
+
+        if not _same_index(index, full.chunk_cache):
+            index = full.chunk_cache
+            diff = AnalysisDiff({chunk.start: chunk for chunk in old_index.values()},
+                                {chunk.start: chunk for chunk in index.values()})
+            diff.changed_ranges = ranges
+            diff.invalidated = len(index)
+            diff.fallback = True
+
+    return index, diff
@@ -1,5 +1,7 @@
-import colorama
+import io
+import sys
 from opcodes import *
+from decoder import JR_FAMILY
 
 HW_REGISTERS = {0x00: "JOYP", 0x01: "SB", 0x02: "SC", 0x04: "DIV",
                 0x05: "TIMA", 0x06: "TMA", 0x07: "TAC", 0x0f: "IF",
@@ -18,7 +20,17 @@ HW_REGISTERS = {0x00: "JOYP", 0x01: "SB", 0x02: "SC", 0x04: "DIV",
                 0x73: "UNKNOWN3", 0x74: "UNKNOWN4", 0x75: "UNKNOWN5", 0x76: "UNKNOWN6",
                 0x77: "UNKNOWN7", 0xff: "IE"}
 
-JR_FAMILY = {0x18, 0x20, 0x28, 0x30, 0x38}
+FORMAT_TEXT = 'text'
+FORMAT_JSONL = 'jsonl'
+FORMAT_CSV = 'csv'
+OUTPUT_FORMATS = (FORMAT_TEXT, FORMAT_JSONL, FORMAT_CSV)
+
+OUTPUT_BUFFER_SIZE = 1 << 20
+
+CSV_COLUMNS = ('chunk', 'bank', 'address', 'opcode', 'arg', 'length', 'mnemonic', 'warning', 'info', 'hw_register',
+               'jr_target', 'end_warning')
+
+_mnemonics = {}  # (opcode, optional arg) -> formatted mnemonic
 
 
 def u8_correction(value):
@@ -36,51 +48,188 @@ def get_bank_num(internal_address):
     return internal_address >> 16
 
 
-def print_opcodes(chunk):
-    opcode_list = chunk.opcodes
-    start_addr = opcode_list[0].address
-    bank_str = '' if start_addr < 0x4000 else ' (BANK 0x{:X})'.format(get_bank_num(start_addr))
-    fmt_str = '0x{0:X} {1}{2}'
-    header = '----- CHUNK 0x{0:X}{1} -----'.format(get_real_address(start_addr), bank_str)
-    footer = '-' * len(header) + '\n'
+def format_address(internal_address):
+    real_address = get_real_address(internal_address)
 
-    warning_str = ' [{}]'
+    if 0x4000 <= real_address < 0x8000:
+        return '0x{:X} (BANK 0x{:X})'.format(real_address, get_bank_num(internal_address))
 
-    print(header)
+    return '0x{:X}'.format(real_address)
 
-    for op in opcode_list:
-        real_address = get_real_address(op.address)
-        warning = ''
-        color = ''
 
-        if op.warning is not None:
-            warning = warning_str.format(op.warning)
-            color = colorama.Fore.YELLOW
+def get_mnemonic(opcode, optional_arg):
+    key = (opcode, optional_arg)
+    mnemonic = _mnemonics.get(key)
 
-        elif op.info is not None:
-            warning = warning_str.format(op.info)
-            color = colorama.Fore.GREEN
+    if mnemonic is None:
+        if opcode > 0xFF:
+            mnemonic = ext_opcodes[opcode - 0xCB00]
 
-        if op.opcode <= 0xFF:
-            if op.opcode in (0xE0, 0xF0) and op.optional_arg in HW_REGISTERS:
-                warning = warning_str.format(HW_REGISTERS[op.optional_arg])
-                color = colorama.Fore.CYAN
+        elif optional_arg is None:
+            mnemonic = opcodes[opcode]
 
-            elif op.opcode in JR_FAMILY:
-                warning = warning_str.format(hex(get_real_address(op.address) + u8_correction(op.optional_arg) + 2))
-                color = colorama.Fore.GREEN
+        else:
+            mnemonic = opcodes[opcode].format(optional_arg)
 
-            tmp_op = opcodes[op.opcode]
+        _mnemonics[key] = mnemonic
 
-            if op.optional_arg is not None:
-                tmp_op = tmp_op.format(op.optional_arg)
+    return mnemonic
 
-            print(color + fmt_str.format(real_address, tmp_op, warning))
 
-        else:
-            print(color + fmt_str.format(real_address, ext_opcodes[op.opcode - 0xCB00], warning))
+def iter_records(chunk):
+    # (address, opcode, optional arg, length, mnemonic, warning, info, HW register, JR target) for every opcode
+    addresses, codes, args, lengths = chunk.addresses, chunk.codes, chunk.args, chunk.lengths
+    warnings, infos = chunk.warnings, chunk.infos
+
+    for index in range(len(addresses)):
+        address, opcode, length = addresses[index], codes[index], lengths[index]
+        optional_arg = None if length == 1 or opcode > 0xFF else args[index]
+        hw_register = None
+        jr_target = None
+
+        if opcode in (0xE0, 0xF0):
+            hw_register = HW_REGISTERS.get(optional_arg)
+
+        elif opcode in JR_FAMILY:
+            jr_target = get_real_address(address) + u8_correction(optional_arg) + 2
+
+        yield (address, opcode, optional_arg, length, get_mnemonic(opcode, optional_arg), warnings.get(index),
+               infos.get(index), hw_register, jr_target)
+
+
+class TextWriter:
+    def __init__(self, stream, color=False):
+        self.stream = stream
+        self.color = color
+
+        if color:  # colorama is imported only for colored output
+            import colorama
+            self.fore = colorama.Fore
+            self.reset = colorama.Style.RESET_ALL
+
+    def write_chunk(self, chunk):
+        start_addr = chunk.start
+        bank_str = '' if start_addr < 0x4000 else ' (BANK 0x{:X})'.format(get_bank_num(start_addr))
+        header = '----- CHUNK 0x{0:X}{1} -----'.format(get_real_address(start_addr), bank_str)
+        lines = [header]
+
+        for address, _, _, _, mnemonic, warning, info, hw_register, jr_target in iter_records(chunk):
+            note = None
+            color = ''
+
+            if hw_register is not None:
+                note = hw_register
+                color = 'CYAN'
+
+            elif jr_target is not None:
+                note = hex(jr_target)
+                color = 'GREEN'
+
+            elif warning is not None:
+                note = warning
+                color = 'YELLOW'
+
+            elif info is not None:
+                note = info
+                color = 'GREEN'
+
+            line = '0x{0:X} {1}'.format(get_real_address(address), mnemonic)
+
+            if note is not None:
+                line += ' [{}]'.format(note)
+
+            lines.append(getattr(self.fore, color) + line + self.reset if self.color and color else line)
+
+        if chunk.end_warning is not None:
+            line = '### {} ###'.format(chunk.end_warning)
+            lines.append(self.fore.RED + line + self.reset if self.color else line)
+
+        lines.append('-' * len(header) + '\n\n')
+        self.stream.write('\n'.join(lines))
+
+    def close(self):
+        self.stream.close()
 
-    if chunk.end_warning is not None:
-        print(colorama.Fore.RED + '### {} ###'.format(chunk.end_warning))
 
-    print(footer)
+class JsonLinesWriter:
+    # one JSON object per chunk, fields without value are omitted
+    def __init__(self, stream):
+        import json
+
+        self.stream = stream
+        self.encoder = json.JSONEncoder(separators=(',', ':'))
+
+    def write_chunk(self, chunk):
+        ops = []
+
+        for address, opcode, optional_arg, length, mnemonic, warning, info, hw_register, jr_target in \
+                iter_records(chunk):
+            op = {'address': get_real_address(address), 'opcode': opcode, 'length': length, 'mnemonic': mnemonic}
+
+            for key, value in (('arg', optional_arg), ('warning', warning), ('info', info),
+                               ('hw_register', hw_register), ('jr_target', jr_target)):
+                if value is not None:
+                    op[key] = value
+
+            ops.append(op)
+
+        record = {'chunk': get_real_address(chunk.start), 'bank': get_bank_num(chunk.start), 'opcodes': ops}
+
+        if chunk.end_warning is not None:
+            record['end_warning'] = chunk.end_warning
+
+        self.stream.write(self.encoder.encode(record))
+        self.stream.write('\n')
+
+    def close(self):
+        self.stream.close()
+
+
+class CsvWriter:
+    # one row per opcode, chunk end warning is stored in last row of chunk
+    def __init__(self, stream):
+        import csv
+
+        self.stream = stream
+        self.writer = csv.writer(stream, lineterminator='\n')
+        self.writer.writerow(CSV_COLUMNS)
+
+    def write_chunk(self, chunk):
+        chunk_start = get_real_address(chunk.start)
+        bank = get_bank_num(chunk.start)
+        rows = [[chunk_start, bank, get_real_address(address), opcode, optional_arg, length, mnemonic, warning, info,
+                 hw_register, jr_target, None]
+                for address, opcode, optional_arg, length, mnemonic, warning, info, hw_register, jr_target
+                in iter_records(chunk)]
+        rows[-1][-1] = chunk.end_warning
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.stream.close()
+
+
+def open_output(file_name=None):
+    # large buffered text stream, stdout if no file name is given
+    if file_name is None:
+        sys.stdout.flush()
+        return io.open(sys.stdout.fileno(), 'w', buffering=OUTPUT_BUFFER_SIZE, newline='', closefd=False)
+
+    return io.open(file_name, 'w', buffering=OUTPUT_BUFFER_SIZE, newline='')
+
+
+def get_writer(output_format, stream, color=None):
+    # color defaults to stream being a terminal, only text format is colored
+    if output_format == FORMAT_TEXT:
+        return TextWriter(stream, stream.isatty() if color is None else color)
+
+    elif output_format == FORMAT_JSONL:
+        return JsonLinesWriter(stream)
+
+    elif output_format == FORMAT_CSV:
+        return CsvWriter(stream)
+
+    raise ValueError('Unknown output format: {}'.format(output_format))
+
+
+def print_opcodes(chunk):
+    TextWriter(sys.stdout, True).write_chunk(chunk)
@@ -0,0 +1,277 @@
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from helpers import *
+from trace_follower import TraceFollower
+from trace_stats import TraceStats, InstrumentedTraceFollower
+
+_worker_program = None
+
+
+def pack_chunks(chunks):
+    # opcodes of all chunks in four arrays and (length, warnings, infos, end warning) of every chunk,
+    # pickled much faster than chunk objects
+    addresses, codes, args, lengths = array('I'), array('H'), array('H'), array('B')
+    records = []
+
+    for chunk in chunks:
+        addresses.extend(chunk.addresses)
+        codes.extend(chunk.codes)
+        args.extend(chunk.args)
+        lengths.extend(chunk.lengths)
+        records.append((len(chunk), chunk.warnings, chunk.infos, chunk.end_warning))
+
+    return addresses, codes, args, lengths, records
+
+
+def unpack_chunks(packed):
+    # chunks are memoryview slices of packed arrays
+    views = [memoryview(values) for values in packed[:4]]
+    chunks = []
+    start = 0
+
+    for length, warnings, infos, end_warning in packed[4]:
+        chunk = Chunk(end_warning)
+        chunk.addresses, chunk.codes, chunk.args, chunk.lengths = [view[start:start + length] for view in views]
+        chunk.warnings = warnings
+        chunk.infos = infos
+        chunks.append(chunk)
+        start += length
+
+    return chunks
+
+
+def get_ranges(chunks):
+    # (first, last) internal addresses of bytes of chunks, chunk running from bank 0 into switchable bank
+    # gets one range in each bank
+    ranges = []
+
+    for chunk in chunks:
+        start, end = chunk.start, chunk.end
+
+        if start < 0x4000 <= end:
+            ranges.append((start, 0x3FFF))
+            start = (end & 0xFFFF0000) | 0x4000
+
+        ranges.append((start, end))
+
+    return ranges
+
+
+class GroupTrace:
+    # state of follower which traced group of entries, can be pickled, chunks are packed
+    def __init__(self, follower):
+        queue = follower.visit_queue
+
+        self.chunks = pack_chunks(follower.chunk_cache.values())
+        self.local_jumps = follower.local_jumps
+        self.chunk_states = follower.chunk_states
+        self.summaries = follower.summaries
+        self.xrefs = follower.xrefs
+        self.instructions = follower.instructions
+        self.queue_counters = (queue.pushed, queue.duplicates, queue.peak_depth)
+        self.stats = follower.stats if isinstance(follower, InstrumentedTraceFollower) else None
+
+    def restore(self, follower):
+        # continue with this state in new follower
+        for chunk in unpack_chunks(self.chunks):
+            follower.chunk_cache.insert(chunk)
+
+        follower.local_jumps = dict(self.local_jumps)
+        follower.chunk_states = dict(self.chunk_states)
+        follower.summaries = dict(self.summaries)
+        follower.xrefs.update(self.xrefs)
+        follower.instructions = self.instructions
+        follower.visit_queue.pushed, follower.visit_queue.duplicates, follower.visit_queue.peak_depth = \
+            self.queue_counters
+
+
+def trace_group(program, entries, positions, with_stats=False, base=None):
+    # trace entries at positions like follower.follow_entries(entries) traces them, entries before them are
+    # queued too, so paths to them are left for them like in sequential trace, but they aren't traced, follower
+    # continues after base trace if it is given, entries are visited depth first
+    if with_stats:
+        stats = base.stats if base is not None and base.stats is not None else TraceStats()
+        follower = InstrumentedTraceFollower(program, ORDER_DFS, stats)
+
+    else:
+        follower = TraceFollower(program, ORDER_DFS)
+
+    if base is not None:
+        base.restore(follower)
+
+    queue = follower.visit_queue
+    queued = []  # positions of entries in visit queue, duplicate entries aren't queued
+    traced = set(positions)
+
+    for position in range(positions[-1] + 1):
+        size = len(queue)
+        queue.append(entries[position] + (0,))
+
+        if len(queue) > size:
+            queued.append(position)
+
+    while len(queue) > 0:
+        if len(queue) == len(queued) and queued.pop() not in traced:  # next entry belongs to other group
+            queue.pop()
+            continue
+
+        follower.follow_path(*queue.pop())
+
+    return GroupTrace(follower)
+
+
+def get_conflicts(traces):
+    # (group, group) pairs of traces which touch the same code (overlapping chunks) or the same functions
+    # (summaries), traces without conflict don't depend on each other, connected overlaps are reported with
+    # one group of the overlap, which is enough to join all of them
+    ranges = sorted((start, end, group) for group, trace in enumerate(traces)
+                    for start, end in get_ranges(unpack_chunks(trace.chunks)))
+    conflicts = set()
+    last_end, last_group = -1, None
+
+    for start, end, group in ranges:
+        if start <= last_end and group != last_group:
+            conflicts.add((last_group, group))
+
+        if end > last_end:
+            last_end, last_group = end, group
+
+    owners = {}  # summary key -> group
+
+    for group, trace in enumerate(traces):
+        for key in trace.summaries:
+            owner = owners.setdefault(key, group)
+
+            if owner != group:
+                conflicts.add((owner, group))
+
+    return conflicts
+
+
+def join_groups(groups, conflicts):
+    # groups connected by conflicts become one group, entries keep their order, groups are ordered by
+    # their first entry, returns new groups and for every one of them list of old groups it consists of
+    parents = list(range(len(groups)))
+
+    def find(group):
+        while parents[group] != group:
+            parents[group] = parents[parents[group]]
+            group = parents[group]
+
+        return group
+
+    for first, second in conflicts:
+        first, second = find(first), find(second)
+        parents[max(first, second)] = min(first, second)
+
+    members = {}
+
+    for group in range(len(groups)):
+        members.setdefault(find(group), []).append(group)
+
+    roots = sorted(members)
+
+    return [sorted(entry for group in members[root] for entry in groups[group]) for root in roots], \
+        [members[root] for root in roots]
+
+
+def get_base(groups, members):
+    # old group whose trace is the beginning of trace of joined members and positions of entries left to trace
+    # after it, entries are traced from the last one, so it's member with the last entries if no entry of other
+    # member lies between them, (None, all positions) otherwise
+    last = max(members, key=lambda member: groups[member][-1])
+    rest = sorted(position for member in members if member != last for position in groups[member])
+
+    if rest[-1] < groups[last][0]:
+        return last, rest
+
+    return None, sorted(rest + groups[last])
+
+
+def merge_traces(follower, traces):
+    # add state of independent traces to follower, chunks don't overlap, so they are inserted as they are
+    chunks = [chunk for trace in traces for chunk in unpack_chunks(trace.chunks)]
+    chunks.sort(key=lambda chunk: chunk.start)
+
+    for chunk in chunks:
+        follower.chunk_cache.insert(chunk)
+
+    queue = follower.visit_queue
+
+    for trace in traces:
+        follower.local_jumps.update(trace.local_jumps)
+        follower.chunk_states.update(trace.chunk_states)
+        follower.summaries.update(trace.summaries)
+        follower.xrefs.update(trace.xrefs)
+        follower.instructions += trace.instructions
+        queue.pushed += trace.queue_counters[0]
+        queue.duplicates += trace.queue_counters[1]
+        queue.peak_depth = max(queue.peak_depth, trace.queue_counters[2])
+
+        if trace.stats is not None:
+            follower.stats.add_counters(trace.stats)
+
+
+def _init_worker(file_name):
+    global _worker_program
+
+    _worker_program = map_rom(file_name)
+
+
+def _trace_in_worker(entries, positions, with_stats, base):
+    return trace_group(_worker_program, entries, positions, with_stats, base)
+
+
+def trace_parallel(follower, file_name, entries, jobs=1):
+    # trace (pc, bank) entries into empty follower with the same result as follower.trace_entries(entries),
+    # every entry is traced alone in worker process first, entries whose traces touch the same code or the
+    # same functions are traced again together until all traces are independent, independent traces don't
+    # see each other's state, so their union is the sequential result, only depth first order is parallel
+    if follower.visit_queue.order != ORDER_DFS:
+        follower.trace_entries(entries)
+        return 1
+
+    with_stats = isinstance(follower, InstrumentedTraceFollower)
+    entries = list(entries)
+    groups = [[position] for position in range(len(entries))]  # positions of entries
+    traces = [None] * len(groups)
+    work = [(group, groups[group], None) for group in range(len(groups))]  # (group, positions, base trace)
+    pool = ProcessPoolExecutor(jobs, initializer=_init_worker, initargs=(file_name,)) if jobs > 1 else None
+
+    try:
+        while work:
+            if pool is None:
+                results = [trace_group(follower.program, entries, positions, with_stats, base)
+                           for _, positions, base in work]
+
+            else:
+                results = pool.map(_trace_in_worker, [entries] * len(work), [positions for _, positions, _ in work],
+                                   [with_stats] * len(work), [base for _, _, base in work])
+
+            for (group, _, _), trace in zip(work, results):
+                traces[group] = trace
+
+            conflicts = get_conflicts(traces)
+            work = []
+
+            if conflicts:
+                old_groups, old_traces = groups, traces
+                groups, memberships = join_groups(groups, conflicts)
+                traces = [old_traces[members[0]] if len(members) == 1 else None for members in memberships]
+
+                for group, members in enumerate(memberships):
+                    if len(members) > 1:
+                        base, positions = get_base(old_groups, members)
+                        work.append((group, positions, old_traces[base] if base is not None else None))
+
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    merge_traces(follower, traces)
+    follower.collect_register_accesses()
+
+    if with_stats:
+        follower.update_queue_stats()
+
+    return len(groups)
@@ -0,0 +1,132 @@
+import re
+from opcodes import opcodes, ext_opcodes, op_len
+from helpers import calculate_internal_address, get_pc_bank, is_traced
+
+# raw bytes instruction, e.g. 'EA ?? 20'
+_HEX_BYTES = re.compile(r'([0-9A-F]{2}|\?\?)(\s+([0-9A-F]{2}|\?\?))*')
+_ARG = '(0X[0-9A-F]+|(?:0X)?\\?)'
+
+_templates = None  # list of (regex, opcode bytes, operand length), built on first use
+
+
+def _get_templates():
+    global _templates
+
+    if _templates is None:
+        _templates = []
+
+        for opcode, mnemonic in enumerate(opcodes):
+            if mnemonic == 'NONE' or opcode == 0xCB:
+                continue
+
+            text = re.escape(mnemonic.upper().replace(' ', '')).replace(re.escape('0X{0:X}'), _ARG)
+            _templates.append((re.compile(text), (opcode,), op_len[opcode] - 1))
+
+        for opcode, mnemonic in enumerate(ext_opcodes):
+            _templates.append((re.compile(re.escape(mnemonic.upper().replace(' ', ''))), (0xCB, opcode), 0))
+
+    return _templates
+
+
+def compile_instruction(text):
+    # list of byte values, None for wildcard, operands of mnemonics are raw values (JR takes offset)
+    text = text.strip().upper()
+
+    if _HEX_BYTES.fullmatch(text):
+        return [None if value == '??' else int(value, 16) for value in text.split()]
+
+    for regex, opcode_bytes, arg_len in _get_templates():
+        match = regex.fullmatch(text.replace(' ', ''))
+
+        if match is None:
+            continue
+
+        if regex.groups == 0:  # STOP is followed by ignored byte
+            return list(opcode_bytes) + [None] * arg_len
+
+        arg = match[1]
+
+        if arg.endswith('?'):
+            return list(opcode_bytes) + [None] * arg_len
+
+        value = int(arg, 16)
+
+        if value >= 1 << (8 * arg_len):
+            raise ValueError('Argument doesn\'t fit in instruction: {}'.format(text))
+
+        return list(opcode_bytes) + [(value >> (8 * i)) & 0xFF for i in range(arg_len)]
+
+    raise ValueError('Unknown instruction: {}'.format(text))
+
+
+def compile_pattern(text):
+    # instructions separated by ';', each one is mnemonic (LD (0x2000),A; LDH (?),A) or hex bytes (EA ?? 20)
+    pattern = []
+
+    for instruction in text.split(';'):
+        pattern.extend(compile_instruction(instruction))
+
+    if all(value is None for value in pattern):
+        raise ValueError('Pattern has no fixed byte: {}'.format(text))
+
+    return pattern
+
+
+def get_literals(pattern):
+    # (offset, bytes) runs of fixed bytes
+    literals = []
+    start = None
+
+    for offset, value in enumerate(pattern + [None]):
+        if value is not None and start is None:
+            start = offset
+
+        elif value is None and start is not None:
+            literals.append((start, bytes(pattern[start:offset])))
+            start = None
+
+    return literals
+
+
+def find_pattern(program, pattern):
+    # file offsets of pattern matches, longest run of fixed bytes is searched with find and the rest is compared,
+    # matches crossing bank boundary are skipped
+    literals = get_literals(pattern)
+    anchor_offset, anchor = max(literals, key=lambda literal: len(literal[1]))
+    others = [literal for literal in literals if literal[0] != anchor_offset]
+    length = len(pattern)
+    pos = program.find(anchor, anchor_offset)
+
+    while pos >= 0:
+        start = pos - anchor_offset
+
+        if start // 0x4000 == (start + length - 1) // 0x4000 and start + length <= len(program) and \
+                all(program[start + offset:start + offset + len(data)] == data for offset, data in others):
+            yield start
+
+        pos = program.find(anchor, pos + 1)
+
+
+def search(follower, pattern, default_bank, traced_only=False):
+    # (internal address, list of (opcode, optional arg)) for every match, decoded opcodes cover whole pattern,
+    # traced_only keeps matches starting at opcode in follower's chunk cache
+    for offset in find_pattern(follower.program, pattern):
+        pc, bank = get_pc_bank(offset, default_bank)
+        address = calculate_internal_address(pc, bank)
+
+        if traced_only and not is_traced(follower.chunk_cache, address):
+            continue
+
+        ops = []
+        end = pc + len(pattern)
+
+        while pc < end:
+            op = follower.get_single_op(pc, bank)
+
+            if op is None:
+                break
+
+            ops.append((op[1], op[2]))
+            pc += op[3]
+
+        yield address, ops
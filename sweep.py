@@ -0,0 +1,152 @@
+import re
+from bisect import bisect_right
+from helpers import calculate_internal_address, get_rom_offset, get_pc_bank
+
+# opcodes not defined on Game Boy CPU, rare in code, ~4 % of random data
+INVALID_OPCODES = (0xD3, 0xDB, 0xDD, 0xE3, 0xE4, 0xEB, 0xEC, 0xED, 0xF4, 0xFC, 0xFD)
+# RET, RETI, JP nn, JR n, JP (HL) - code regions end with one of them
+END_OPCODES = (0xC9, 0xD9, 0xC3, 0x18, 0xE9)
+
+MIN_REGION = 16  # shorter uncovered regions are ignored
+MAX_INVALID_RATIO = 0.01  # regions with more invalid opcode bytes are data
+MIN_SCORE = 1.0  # returns, jumps and plausible calls per 100 bytes
+MAX_SWEEP_PASSES = 4
+
+_INVALID_TABLE = bytes(1 if i in INVALID_OPCODES else 0 for i in range(256))
+_END_TABLE = bytes(1 if i in END_OPCODES else 0 for i in range(256))
+_PADDING = re.compile(rb'\x00{8,}|\xFF{8,}')
+_UNCOVERED = re.compile(rb'\x00+')
+_CALL = re.compile(rb'\xCD[\x00-\xFF][\x00-\x7F]', re.DOTALL)  # CALL nn with nn in ROM
+
+
+def get_coverage(program, chunk_index):
+    # one byte per ROM byte, 1 if it belongs to traced opcode
+    coverage = bytearray(len(program))
+
+    for chunk in chunk_index.values():
+        start = get_rom_offset(chunk.start)
+        end = get_rom_offset(chunk.end)
+
+        if end - start == chunk.end - chunk.start:
+            coverage[start:end + 1] = b'\x01' * (end - start + 1)
+            continue
+
+        for address, length in zip(chunk.addresses, chunk.lengths):  # chunk runs from bank 0 to switchable bank
+            offset = get_rom_offset(address)
+            coverage[offset:offset + length] = b'\x01' * length
+
+    return coverage
+
+
+def get_uncovered_ranges(program, chunk_index):
+    # (start, end) file offsets of untraced bytes, ranges don't cross bank boundaries, end is exclusive
+    coverage = get_coverage(program, chunk_index)
+    ranges = []
+
+    for bank_start in range(0, len(coverage), 0x4000):
+        for match in _UNCOVERED.finditer(coverage, bank_start, min(bank_start + 0x4000, len(coverage))):
+            ranges.append(match.span())
+
+    return ranges
+
+
+def get_regions(program, start, end):
+    # split uncovered range at 0x00 / 0xFF padding runs
+    for match in _PADDING.finditer(program, start, end):
+        if match.start() - start >= MIN_REGION:
+            yield start, match.start()
+
+        start = match.end()
+
+    if end - start >= MIN_REGION:
+        yield start, end
+
+
+def get_call_target(program, offset, target, default_bank):
+    # file offset of CALL target, None if it is outside of ROM or starts with invalid opcode
+    if target >= 0x4000:
+        bank = offset // 0x4000
+        target = (bank if bank > 0 else default_bank) * 0x4000 + target - 0x4000
+
+    if target >= len(program) or program[target] in INVALID_OPCODES:
+        return None
+
+    return target
+
+
+def score_region(program, start, end, default_bank):
+    # returns, jumps and plausible calls per 100 bytes and offsets of call targets,
+    # score is 0 for regions that look like data
+    data = program[start:end]
+
+    if data.translate(_INVALID_TABLE).count(1) > len(data) * MAX_INVALID_RATIO:
+        return 0, []
+
+    ends = data.translate(_END_TABLE).count(1)
+
+    if ends == 0:
+        return 0, []
+
+    targets = [get_call_target(program, start + match.start(), match[0][1] | (match[0][2] << 8), default_bank)
+               for match in _CALL.finditer(data)]
+    targets = [target for target in targets if target is not None]
+
+    return (ends + len(targets)) * 100 / len(data), targets
+
+
+def find_candidates(program, chunk_index, default_bank=1, min_score=MIN_SCORE):
+    # (pc, bank, info) entry points in untraced code-like regions, call targets first (most called first),
+    # then region starts (best score first)
+    ranges = get_uncovered_ranges(program, chunk_index)
+    uncovered = [start for start, _ in ranges]
+    callers = {}  # call target offset -> number of calls
+    regions = []
+
+    for start, end in ranges:
+        for region_start, region_end in get_regions(program, start, end):
+            score, targets = score_region(program, region_start, region_end, default_bank)
+
+            if score < min_score:
+                continue
+
+            regions.append((score, region_start))
+
+            for target in targets:
+                callers[target] = callers.get(target, 0) + 1
+
+    candidates = []
+
+    for target, count in sorted(callers.items(), key=lambda item: (-item[1], item[0])):
+        pos = bisect_right(uncovered, target) - 1
+
+        if pos >= 0 and target < ranges[pos][1]:  # target isn't traced yet
+            candidates.append(get_pc_bank(target, default_bank) + ('Sweep: call target, {} calls'.format(count),))
+
+    for score, start in sorted(regions, key=lambda region: (-region[0], region[1])):
+        candidates.append(get_pc_bank(start, default_bank) + ('Sweep: region score {:.1f}'.format(score),))
+
+    return candidates
+
+
+def sweep(follower, default_bank=1, min_score=MIN_SCORE, max_passes=MAX_SWEEP_PASSES):
+    # trace code-like regions the follower didn't reach, first opcode of every seeded chunk gets info,
+    # returns number of seeded entry points
+    seeded = 0
+
+    for _ in range(max_passes):
+        candidates = find_candidates(follower.program, follower.chunk_cache, default_bank, min_score)
+
+        if not candidates:
+            break
+
+        follower.trace_entries([(pc, bank) for pc, bank, _ in candidates])
+        seeded += len(candidates)
+
+        for pc, bank, info in candidates:
+            address = calculate_internal_address(pc, bank)
+            chunk = follower.chunk_cache.get(address)
+
+            if chunk is not None and chunk.start == address:
+                chunk.infos.setdefault(0, info)
+
+    return seeded
@@ -1,27 +1,18 @@
-import bintrees
+import time
+from bisect import bisect_left
 from opcodes import *
 from helpers import *
 from dispatcher import *
+from decoder import *
+from xrefs import *
 
-# opcode families
-PUSH_FAMILY = {0xC5, 0xD5, 0xE5, 0xF5}
-POP_FAMILY = {0xC1, 0xD1, 0xE1, 0xF1}
-RST_FAMILY = {0xC7, 0xCF, 0xD7, 0xDF, 0xE7, 0xEF, 0xF7, 0xFF}
-JUMP_FAMILY = {0x18, 0xC3}
-RET_FAMILY = {0xC9, 0xD9}
+# bump when tracing results change, invalidates cached analyses
+ANALYZER_VERSION = 7  # 7: chunk states are kept
 
-JR_COND_FAMILY = {0x20, 0x28, 0x30, 0x38}
-RET_COND_FAMILY = {0xC0, 0xC8, 0xD0, 0xD8}
-JP_COND_FAMILY = {0xC2, 0xCA, 0xD2, 0xDA}
-CALL_FAMILY = {0xCD, 0xC4, 0xCC, 0xD4, 0xDC}
-CALL_RST_FAMILY = CALL_FAMILY | RST_FAMILY
-
-# opcodes that ends chunk
-#       JP(HL)
-end_op = {0xE9} | JUMP_FAMILY | RET_FAMILY
-
-# opcodes that causes split in path
-split_op = JR_COND_FAMILY | JP_COND_FAMILY | CALL_FAMILY | RST_FAMILY
+# function summary limits, functions exceeding them get unknown summary
+MAX_SUMMARY_DEPTH = 32
+MAX_SUMMARY_OPCODES = 0x1000
+MAX_SUMMARY_STACK = 16
 
 
 # helper functions
@@ -32,127 +23,274 @@ def u8_correction(value):
     return value
 
 
-def calculate_internal_address(pc, bank):
-    if pc < 0x4000:
-        return pc
+def is_valid_pc(pc):
+    return (pc is not None) and (pc < 0x8000)
 
-    else:
-        return (bank << 16) | pc
 
+CHECKPOINT_INTERVAL = 60  # seconds between saved tracer states
 
-def merge_chunks(chunk1, chunk2):
-    s1, s2 = chunk1[0].address, chunk2[0].address
+RST_VECTORS = tuple(range(0x00, 0x40, 0x08))
+INTERRUPT_VECTORS = (0x40, 0x48, 0x50, 0x58, 0x60)
 
-    if s1 < s2:
-        cross_point = chunk1.index(s2)
-        return chunk1[0:cross_point] + chunk2
+# names of budget limits
+LIMIT_TIME = 'time'
+LIMIT_INSTRUCTIONS = 'instructions'
+LIMIT_CHUNKS = 'chunks'
 
-    elif s1 > s2:
-        cross_point = chunk2.index(s1)
-        return chunk2[0:cross_point] + chunk1
 
-    else:
-        return chunk1
+class TraceBudget:
+    # limits of tracing, None is unlimited, checked between paths so chunk cache is always consistent,
+    # time runs from budget creation
+    def __init__(self, max_time=None, max_instructions=None, max_chunks=None):
+        self.max_time = max_time  # seconds
+        self.max_instructions = max_instructions
+        self.max_chunks = max_chunks
+        self.start_time = time.perf_counter()
 
+    def get_exceeded(self, follower):
+        # name of exceeded limit, None if tracing can continue
+        if self.max_chunks is not None and len(follower.chunk_cache) >= self.max_chunks:
+            return LIMIT_CHUNKS
 
-def is_valid_pc(pc):
-    return (pc is not None) and (pc < 0x8000)
+        if self.max_instructions is not None and follower.instructions >= self.max_instructions:
+            return LIMIT_INSTRUCTIONS
 
+        if self.max_time is not None and time.perf_counter() - self.start_time >= self.max_time:
+            return LIMIT_TIME
 
-class TraceFollower:
-    program = []
-    visit_queue = []
-    chunk_cache = bintrees.RBTree()
+        return None
+
+
+def get_entry_points(start_pc, start_bank):
+    # start address first, then RST and interrupt vectors
+    entries = [(start_pc, start_bank)]
+    entries.extend((pc, start_bank) for pc in RST_VECTORS + INTERRUPT_VECTORS if pc != start_pc)
 
-    def __init__(self, program_data):
+    return entries
+
+
+class TraceFollower:
+    def __init__(self, program_data, visit_order=ORDER_DFS):
         self.program = program_data
+        self.cartridge = Cartridge(program_data)
+        self.chunk_cache = ChunkIndex()
+        self.xrefs = XrefIndex()
+        self.visit_queue = VisitQueue(visit_order)
+        view = memoryview(program_data)
+        self.bank_views = [view[i:i + 0x4000] for i in range(0, len(view), 0x4000)]
+        self.summaries = {}  # (internal address, bank) -> FunctionSummary
+        self.local_jumps = {}  # chunk start -> [(source address, pc, bank, stack balance)] of jumps inside chunk
+        self.chunk_states = {}  # chunk start -> [(internal address, bank, stack balance)] at start and after changes
+        self.pending_summaries = set()
+        self.instructions = 0  # opcodes in chunks decoded by follow_path
+        self.budget = None  # TraceBudget
+        self.checkpoint = None  # object with is_due() and save(follower), called between paths
+        self.exceeded = None  # name of exceeded budget limit, visit queue keeps remaining paths
+
+    def in_rom(self, pc, bank):
+        if not is_valid_pc(pc) or pc < 0:
+            return False
+
+        view = self.get_bank_view(pc, bank)
+
+        return view is not None and (pc & 0x3FFF) < len(view)
 
     def get_byte(self, pc, bank):
-        if pc < 0x4000:
-            return self.program[pc]
+        # None if address is outside of ROM
+        if not self.in_rom(pc, bank):
+            return None
 
-        else:
-            return self.program[(pc - 0x4000) + 0x4000 * bank]
+        return self.get_bank_view(pc, bank)[pc & 0x3FFF]
 
     def get_single_op(self, pc, bank):
+        # None if opcode doesn't fit in ROM
         opcode = self.get_byte(pc, bank)
+
+        if opcode is None:
+            return None
+
         op_length = op_len[opcode]
         optional_arg = None
+        arg_bytes = [self.get_byte(pc + i, bank) for i in range(1, op_length)]
+
+        if None in arg_bytes:
+            return None
 
         if opcode == 0xCB:
-            opcode = 0xCB00 + self.get_byte(pc + 1, bank)
-            op_length = 2
+            opcode = 0xCB00 + arg_bytes[0]
 
-        else:
-            if op_length == 2:
-                optional_arg = self.get_byte(pc + 1, bank)
+        elif op_length == 2:
+            optional_arg = arg_bytes[0]
+
+        elif op_length == 3:
+            optional_arg = (arg_bytes[1] << 8) | arg_bytes[0]
+
+        return calculate_internal_address(pc, bank), opcode, optional_arg, op_length
+
+    def get_bank_view(self, pc, bank):
+        # None if bank is not in ROM
+        bank = 0 if pc < 0x4000 else bank
+
+        return self.bank_views[bank] if bank < len(self.bank_views) else None
+
+    def new_register_state(self, chunk):
+        return RegisterState(chunk)
+
+    def resolve_bank(self, reg_state, address, bank):
+        return get_new_bank(reg_state, self.cartridge, address, bank)
+
+    def resolve_hl(self, reg_state):
+        return get_hl_mod(reg_state)
+
+    def get_run(self, pc, bank, chunk, reg_state, stop_at_chunks=True):
+        view = self.get_bank_view(pc, bank)
+
+        if view is None:
+            return pc, FLOW_OUT_OF_ROM
+
+        view_pc = 0 if pc < 0x4000 else 0x4000
+        base_address = calculate_internal_address(view_pc, bank)
+        end = len(view)
+        next_start = self.chunk_cache.next_start(base_address + pc - view_pc) if stop_at_chunks else None
+
+        if next_start is not None and next_start - base_address < end:  # stop at beginning of next chunk
+            end = next_start - base_address
+
+        if pc - view_pc == end < len(view):  # already at beginning of next chunk
+            return pc, FLOW_NONE
+
+        pos, flow = decode_run(view, pc - view_pc, end, base_address, chunk, reg_state)
+
+        if view_pc + pos == pc:  # opcode crosses bank boundary or beginning of next chunk
+            op = self.get_single_op(pc, bank)
+
+            if op is None:
+                return pc, FLOW_OUT_OF_ROM
+
+            address, opcode, optional_arg, op_length = op
+            mods = get_mods(opcode)
+            chunk.append(address, opcode, optional_arg, op_length)
 
-            elif op_length == 3:
-                optional_arg = (self.get_byte(pc + 2, bank) << 8) | self.get_byte(pc + 1, bank)
+            if mods:
+                reg_state.update(len(chunk) - 1, optional_arg, mods)
 
-        return Opcode(calculate_internal_address(pc, bank), opcode, optional_arg, op_length)
+            if end < len(view):
+                return pc + op_length, FLOW_OVERLAP
+
+            return pc + op_length, get_flow(opcode)
+
+        return view_pc + pos, flow
 
     def get_chunk(self, pc, bank, stack_balance):
-        chunk_start = calculate_internal_address(pc, bank)
-        chunk_opcodes = []
+        chunk = Chunk()
+        reg_state = self.new_register_state(chunk)
         next_addr = None
         error_end = None
+        joined = False
+        targets = []  # (source address, pc, bank, stack balance) of calls and conditional jumps
+        states = [(calculate_internal_address(pc, bank), bank, stack_balance)]
+
+        while True:
+            pc, flow = self.get_run(pc, bank, chunk, reg_state)
+
+            if flow == FLOW_NONE:  # end of bank view or beginning of next chunk
+                if calculate_internal_address(pc, bank) not in self.chunk_cache:
+                    continue
+
+                next_addr = pc
+                joined = True
+                break
 
-        op = self.get_single_op(pc, bank)
-        chunk_opcodes.append(op)
-        pc += op.opcode_len
+            elif flow == FLOW_OVERLAP:
+                error_end = 'Opcode overlaps next chunk!'
+                break
 
-        while op.opcode not in end_op:
-            # if LD A, (0x2000 ~ 0x3FFF) [change bank command]
-            if op.opcode == 0xEA and 0x2000 <= op.optional_arg <= 0x3FFF:
+            elif flow == FLOW_OUT_OF_ROM:
+                error_end = 'Reading outside of ROM!'
+                break
+
+            op = chunk[-1]
+            new_bank = None
+
+            if flow >= FLOW_END_FIRST:
+                break
+
+            # if LD (0x2000 ~ 0x3FFF),A [change bank command]
+            elif flow == FLOW_STORE_A and self.cartridge.is_bank_write(op.optional_arg):
                 try:
-                    bank = get_new_bank(chunk_opcodes)
+                    new_bank = self.resolve_bank(reg_state, op.optional_arg, bank)
 
                 except Exception as e:
                     op.warning = e.args[0]
 
-            if op.opcode in PUSH_FAMILY:
+            elif flow == FLOW_PUSH:
                 if stack_balance < 0:
                     op.warning = 'Overwriting previous stack frame!'
 
                 stack_balance += 1
 
-            elif op.opcode in POP_FAMILY:
+            elif flow == FLOW_POP:
                 if stack_balance <= 0:
                     op.warning = 'Popped additional stack frame!'
 
                 stack_balance -= 1
 
-            elif op.opcode in split_op:
+            elif flow >= FLOW_SPLIT_FIRST:
                 split_dst = op.optional_arg
 
-                if op.opcode in JR_COND_FAMILY:
+                if flow == FLOW_JR_COND:
                     split_dst = pc + u8_correction(split_dst)
 
-                elif op.opcode in RST_FAMILY:
+                elif flow == FLOW_RST:
                     split_dst = ((op.opcode >> 3) & 7) * 0x8
 
-                if calculate_internal_address(split_dst, bank) not in self.chunk_cache and split_dst < 0x8000:
-                    if op.opcode in CALL_RST_FAMILY:
-                        self.visit_queue.append((split_dst, bank, 0))  # TODO: suspend current path, trace this function
+                self.xrefs.add_code(XREF_CALL if flow >= FLOW_CALL else XREF_JUMP, split_dst, bank, op.address)
 
-                    else:
-                        self.visit_queue.append((split_dst, bank, stack_balance))
+                if split_dst < 0x8000:
+                    targets.append((op.address, split_dst, bank, 0 if flow >= FLOW_CALL else stack_balance))
 
-            op = self.get_single_op(pc, bank)
-            chunk_opcodes.append(op)
-            pc += op.opcode_len
+                if flow >= FLOW_CALL and split_dst < 0x8000:
+                    summary = self.get_summary(split_dst, bank)
+
+                    if summary.returns is False and (op.opcode == 0xCD or flow == FLOW_RST):
+                        op.info = 'Function never returns'
+                        break
+
+                    if summary.stack_effect and (op.opcode == 0xCD or flow == FLOW_RST):
+                        stack_balance += summary.stack_effect  # function returns with values pushed or popped
+
+                    new_bank = summary.bank
 
-        if op.opcode in JUMP_FAMILY:
+            if new_bank is not None and new_bank != bank:
+                bank = new_bank
+
+                if pc >= 0x4000:  # code switched its own bank, continue in new chunk
+                    next_addr = pc
+                    break
+
+            if stack_balance != states[-1][2] or bank != states[-1][1]:
+                states.append((calculate_internal_address(pc, bank), bank, stack_balance))
+
+        if flow == FLOW_JR or flow == FLOW_JP:
             next_addr = op.optional_arg
 
-            if op.opcode == 0x18:
+            if flow == FLOW_JR:
                 next_addr = pc + u8_correction(next_addr)
 
-        elif op.opcode == 0xE9:
-            error_end, next_addr = get_hl_mod(chunk_opcodes)
+            self.xrefs.add_code(XREF_JUMP, next_addr, bank, op.address)
 
-        else:
+        elif flow == FLOW_JP_HL:
+            error_end, next_addr = self.resolve_hl(reg_state)
+
+            if next_addr is not None:
+                self.xrefs.add_code(XREF_JUMP, next_addr, bank, op.address)
+
+        if (flow == FLOW_JR or flow == FLOW_JP or flow == FLOW_JP_HL) and next_addr is not None and \
+                is_inside(chunk, calculate_internal_address(next_addr, bank)):  # loop, path is already traced
+            targets.append((op.address, next_addr, bank, stack_balance))
+            next_addr = None
+
+        elif flow == FLOW_RET:
             if stack_balance < 0:
                 error_end = 'Detected stack manipulation: chunk pops return address!'
 
@@ -162,28 +300,282 @@ class TraceFollower:
         if next_addr is not None and next_addr >= 0x8000:
             error_end = 'Dynamic Execution: program go out of ROM!'
 
-        chunk_end = calculate_internal_address(pc - 1, bank)
+        chunk.end_warning = error_end
+        self.add_targets(chunk, targets)
+
+        if len(chunk) > 0:
+            if states[-1][0] > chunk.end:  # change after last opcode
+                states.pop()
+
+            self.chunk_states[chunk.start] = states
+
+        return chunk, next_addr, bank, stack_balance, joined
+
+    def add_targets(self, chunk, targets):
+        # targets inside chunk are already traced, they split it only when it is split between jump and target,
+        # targets in the middle of other chunks split them when visited
+        local_jumps = []
+
+        for target in targets:
+            address = calculate_internal_address(target[1], target[2])
+
+            if is_inside(chunk, address):
+                local_jumps.append(target)
+
+            else:
+                other = self.chunk_cache.get(address)
+
+                if other is None or other.start != address:
+                    self.visit_queue.append(target[1:])
+
+        if local_jumps:
+            self.local_jumps[chunk.start] = local_jumps
+
+    def get_summary(self, pc, bank, depth=0):
+        key = (calculate_internal_address(pc, bank), bank)
+
+        if key in self.summaries:
+            return self.summaries[key]
+
+        elif key in self.pending_summaries or depth > MAX_SUMMARY_DEPTH:  # recursion
+            return UNKNOWN_SUMMARY
+
+        self.pending_summaries.add(key)
+        summary = self.analyze_function(pc, bank, depth)
+        self.pending_summaries.discard(key)
+        self.summaries[key] = summary
 
-        return Rang(chunk_start, chunk_end), Chunk(chunk_opcodes, error_end), next_addr, bank, stack_balance
+        return summary
+
+    def analyze_function(self, pc, bank, depth):
+        # walk all paths of function starting at pc (without touching chunk cache) and collect its exits,
+        # walk is aborted as soon as some path can't be followed
+        paths = [(pc, bank, 0)]
+        visited = {}  # internal address -> stack balance
+        exits = set()  # (stack balance, bank) at RET
+        opcode_count = 0
+        unknown = False
+
+        while len(paths) > 0 and not unknown:
+            pc, bank, stack_balance = paths.pop()
+            address = calculate_internal_address(pc, bank)
+
+            if address in visited:
+                unknown = visited[address] != stack_balance  # loop changes stack
+                continue
+
+            elif not self.in_rom(pc, bank) or abs(stack_balance) > MAX_SUMMARY_STACK or \
+                    opcode_count > MAX_SUMMARY_OPCODES:
+                unknown = True
+                break
+
+            visited[address] = stack_balance
+            chunk = Chunk()
+            reg_state = self.new_register_state(chunk)
+
+            while True:
+                pc, flow = self.get_run(pc, bank, chunk, reg_state, False)
+
+                if flow == FLOW_NONE:
+                    continue
+
+                op = chunk[-1]
+
+                if flow == FLOW_STORE_A and self.cartridge.is_bank_write(op.optional_arg):
+                    try:
+                        bank = self.resolve_bank(reg_state, op.optional_arg, bank)
+
+                    except Exception:
+                        pass
+
+                elif flow == FLOW_PUSH:
+                    stack_balance += 1
+
+                elif flow == FLOW_POP:
+                    stack_balance -= 1
+
+                elif flow == FLOW_RET_COND:
+                    exits.add((stack_balance, bank))
+
+                elif flow == FLOW_JR_COND:
+                    paths.append((pc + u8_correction(op.optional_arg), bank, stack_balance))
+
+                elif flow == FLOW_JP_COND:
+                    paths.append((op.optional_arg, bank, stack_balance))
+
+                elif flow == FLOW_CALL or flow == FLOW_RST:
+                    call_dst = op.optional_arg if flow == FLOW_CALL else ((op.opcode >> 3) & 7) * 0x8
+                    summary = self.get_summary(call_dst, bank, depth + 1) if call_dst < 0x8000 else UNKNOWN_SUMMARY
+
+                    if summary.returns is None:
+                        unknown = True
+                        break
+
+                    elif not summary.returns and (op.opcode == 0xCD or flow == FLOW_RST):
+                        break
+
+                    if summary.bank is not None:
+                        bank = summary.bank
+
+                elif flow == FLOW_JR:
+                    paths.append((pc + u8_correction(op.optional_arg), bank, stack_balance))
+                    break
+
+                elif flow == FLOW_JP:
+                    paths.append((op.optional_arg, bank, stack_balance))
+                    break
+
+                elif flow == FLOW_JP_HL:
+                    error, hl = self.resolve_hl(reg_state)
+
+                    if error is None:
+                        paths.append((hl, bank, stack_balance))
+
+                    else:
+                        unknown = True
+
+                    break
+
+                elif flow == FLOW_RET:
+                    exits.add((stack_balance, bank))
+                    break
+
+                elif flow == FLOW_OVERLAP:
+                    break
+
+                elif flow == FLOW_OUT_OF_ROM:
+                    unknown = True
+                    break
+
+            opcode_count += len(chunk)
+
+        stack_effects = {stack_balance for stack_balance, _ in exits}
+        banks = {bank for _, bank in exits}
+
+        if unknown:
+            return FunctionSummary(True if 0 in stack_effects else None, None, None)
+
+        # exit with other balance than 0 means stack manipulation, so function may continue anywhere
+        if 0 in stack_effects:
+            returns = True
+
+        else:
+            returns = None if len(exits) > 0 else False
+
+        return FunctionSummary(returns,
+                               stack_effects.pop() if len(stack_effects) == 1 else None,
+                               banks.pop() if len(banks) == 1 else None)
 
     def follow_path(self, pc, bank, stack_balance):
-        while is_valid_pc(pc) and calculate_internal_address(pc, bank) not in self.chunk_cache:
-            if calculate_internal_address(pc, bank) not in self.chunk_cache:
-                chunk_range, chunk, pc, bank, stack_balance = self.get_chunk(pc, bank, stack_balance)
+        while self.in_rom(pc, bank):
+            address = calculate_internal_address(pc, bank)
+            chunk = self.chunk_cache.get(address)
 
-                if chunk_range.end in self.chunk_cache:
-                    old = self.chunk_cache[chunk_range.end]
-                    new = merge_chunks(chunk.opcodes, old.opcodes)
+            if chunk is not None:
+                if chunk.start != address:  # jump target in the middle of other chunk
+                    self.split_chunk(chunk.start, address)
 
-                    self.chunk_cache.remove(chunk_range.end)
-                    chunk_range = Rang(new[0].address, new[-1].address)
-                    chunk = Chunk(new, old.end_warning)
+                break
 
-                self.chunk_cache.insert(chunk_range, chunk)
+            chunk, pc, bank, stack_balance, joined = self.get_chunk(pc, bank, stack_balance)
+            self.instructions += len(chunk)
 
-    def trace_all_paths(self, start_pc, start_bank):
+            if len(chunk) == 0:  # first opcode doesn't fit in ROM
+                break
+
+            self.chunk_cache.insert(chunk)
+
+            if joined:  # chunk falls into beginning of next chunk, which stays on its own
+                break
+
+    def split_chunk(self, start, address):
+        # split chunk beginning at start so that address starts new chunk, jumps inside chunk which now cross its
+        # beginning are visited as targets in the middle of other chunk, False if address isn't opcode boundary
+        if self.chunk_cache.split(address) is None:
+            return False
+
+        head, tail = [], []
+
+        for target in self.local_jumps.pop(start, ()):
+            target_address = calculate_internal_address(target[1], target[2])
+
+            if target_address == address:
+                continue
+
+            elif (target[0] < address) != (target_address < address):
+                self.visit_queue.append(target[1:])
+
+            else:
+                (head if target[0] < address else tail).append(target)
+
+        if head:
+            self.local_jumps[start] = head
+
+        if tail:
+            self.local_jumps[address] = tail
+
+        states = self.chunk_states.pop(start, None)
+
+        if states is not None:  # tail starts with state at address
+            position = bisect_left(states, (address,))
+            self.chunk_states[start] = states[:position]
+            self.chunk_states[address] = states[position:] if position < len(states) and \
+                states[position][0] == address else [(address,) + states[position - 1][1:]] + states[position:]
+
+        return True
+
+    def stream_path(self, pc, bank, stack_balance):
+        # like follow_path, but chunks are never split afterwards, so every chunk is final once decoded,
+        # only its range stays in chunk cache
+        while self.in_rom(pc, bank) and calculate_internal_address(pc, bank) not in self.chunk_cache:
+            chunk, pc, bank, stack_balance, joined = self.get_chunk(pc, bank, stack_balance)
+
+            if len(chunk) == 0:  # first opcode doesn't fit in ROM
+                break
+
+            self.chunk_cache.insert(Rang(chunk.start, chunk.end))
+            self.xrefs.add_register_accesses(chunk)
+
+            yield chunk
+
+            if joined:  # chunk falls into beginning of next chunk
+                break
+
+    def iter_chunks(self, start_pc, start_bank):
+        # yield chunks in discovery order
         self.visit_queue.append((start_pc, start_bank, 0))
 
         while len(self.visit_queue) > 0:
+            next_path = self.visit_queue.pop()
+            yield from self.stream_path(next_path[0], next_path[1], next_path[2])
+
+    def trace_all_paths(self, start_pc, start_bank):
+        self.trace_entries([(start_pc, start_bank)])
+
+    def trace_entries(self, entries):
+        # trace from every (pc, bank) entry, can be called again to add entries to existing analysis
+        self.follow_entries(entries)
+        self.collect_register_accesses()
+
+    def collect_register_accesses(self):
+        # HW register accesses don't depend on bank, so they are collected from final chunks
+        for chunk in self.chunk_cache.values():
+            self.xrefs.add_register_accesses(chunk)
+
+    def follow_entries(self, entries):
+        # like trace_entries, but HW register accesses are not collected, stops early when budget is exceeded
+        for pc, bank in entries:
+            self.visit_queue.append((pc, bank, 0))
+
+        while len(self.visit_queue) > 0:
+            if self.budget is not None:
+                self.exceeded = self.budget.get_exceeded(self)
+
+                if self.exceeded is not None:
+                    break
+
+            if self.checkpoint is not None and self.checkpoint.is_due():
+                self.checkpoint.save(self)
+
             next_path = self.visit_queue.pop()
             self.follow_path(next_path[0], next_path[1], next_path[2])
@@ -0,0 +1,176 @@
+import time
+from contextlib import contextmanager
+from helpers import *
+from dispatcher import RegisterState
+from trace_follower import TraceFollower
+
+COUNTERS = (('instructions', 'instructions decoded'),
+            ('chunks_created', 'chunks created'),
+            ('chunks_joined', 'chunks ending at beginning of next chunk'),
+            ('chunks_split', 'chunks split'),
+            ('paths_rejected', 'paths rejected (already traced or outside ROM)'),
+            ('cache_lookups', 'chunk cache lookups'),
+            ('cache_hits', 'chunk cache hits'),
+            ('next_start_lookups', 'chunk cache next start lookups'),
+            ('bank_resolves', 'get_new_bank invocations'),
+            ('bank_resolve_failures', 'get_new_bank failures'),
+            ('hl_resolves', 'get_hl_mod invocations'),
+            ('hl_resolve_failures', 'get_hl_mod failures'),
+            ('resolver_opcodes', 'opcodes tracked for resolvers (A and HL effects)'),
+            ('summaries', 'function summaries computed'))
+
+
+class TraceStats:
+    def __init__(self):
+        for name, _ in COUNTERS:
+            setattr(self, name, 0)
+
+        self.queue_pushed = 0
+        self.queue_duplicates = 0
+        self.queue_peak_depth = 0
+        self.phase_times = {}  # phase name -> wall time in seconds
+
+    @contextmanager
+    def phase(self, name):
+        start_time = time.perf_counter()
+
+        try:
+            yield
+
+        finally:
+            self.phase_times[name] = self.phase_times.get(name, 0) + time.perf_counter() - start_time
+
+    def add_counters(self, other):
+        # counters of other stats (worker process) are added, phase times are not
+        for name, _ in COUNTERS:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+
+        self.queue_pushed += other.queue_pushed
+        self.queue_duplicates += other.queue_duplicates
+        self.queue_peak_depth = max(self.queue_peak_depth, other.queue_peak_depth)
+
+    def get_lines(self):
+        lines = ['{:<50} {:>12}'.format(description, getattr(self, name)) for name, description in COUNTERS]
+        lines.append('{:<50} {:>12}'.format('visit queue pushes', self.queue_pushed))
+        lines.append('{:<50} {:>12}'.format('visit queue duplicates', self.queue_duplicates))
+        lines.append('{:<50} {:>12}'.format('visit queue peak depth', self.queue_peak_depth))
+        lines.extend('{:<50} {:>12.4f}'.format('time: ' + name + ' [s]', seconds)
+                     for name, seconds in self.phase_times.items())
+
+        return lines
+
+
+class CountingChunkIndex(ChunkIndex):
+    def __init__(self, stats):
+        super().__init__()
+        self.stats = stats
+
+    def get(self, address):
+        chunk = super().get(address)
+        self.stats.cache_lookups += 1
+
+        if chunk is not None:
+            self.stats.cache_hits += 1
+
+        return chunk
+
+    def next_start(self, address):
+        self.stats.next_start_lookups += 1
+
+        return super().next_start(address)
+
+    def split(self, address):
+        tail = super().split(address)
+
+        if tail is not None:
+            self.stats.chunks_split += 1
+
+        return tail
+
+
+class CountingRegisterState(RegisterState):
+    # resolvers look up forward tracked values, tracking is the work they depend on
+    def __init__(self, chunk, stats):
+        super().__init__(chunk)
+        self.stats = stats
+
+    def update(self, index, optional_arg, mods):
+        self.stats.resolver_opcodes += 1
+        super().update(index, optional_arg, mods)
+
+
+class InstrumentedTraceFollower(TraceFollower):
+    # TraceFollower recording counters into stats, plain TraceFollower doesn't pay for them
+    def __init__(self, program_data, visit_order=ORDER_DFS, stats=None):
+        super().__init__(program_data, visit_order)
+        self.stats = TraceStats() if stats is None else stats
+        self.chunk_cache = CountingChunkIndex(self.stats)
+
+    def resolve_bank(self, reg_state, address, bank):
+        self.stats.bank_resolves += 1
+
+        try:
+            return super().resolve_bank(reg_state, address, bank)
+
+        except Exception:
+            self.stats.bank_resolve_failures += 1
+            raise
+
+    def resolve_hl(self, reg_state):
+        self.stats.hl_resolves += 1
+        error, hl = super().resolve_hl(reg_state)
+
+        if error is not None:
+            self.stats.hl_resolve_failures += 1
+
+        return error, hl
+
+    def get_run(self, pc, bank, chunk, reg_state, stop_at_chunks=True):
+        count = len(chunk)
+        result = super().get_run(pc, bank, chunk, reg_state, stop_at_chunks)
+        self.stats.instructions += len(chunk) - count
+
+        return result
+
+    def get_chunk(self, pc, bank, stack_balance):
+        self.stats.chunks_created += 1
+        result = super().get_chunk(pc, bank, stack_balance)
+
+        if result[4]:
+            self.stats.chunks_joined += 1
+
+        return result
+
+    def analyze_function(self, pc, bank, depth):
+        self.stats.summaries += 1
+
+        return super().analyze_function(pc, bank, depth)
+
+    def new_register_state(self, chunk):
+        return CountingRegisterState(chunk, self.stats)
+
+    def follow_path(self, pc, bank, stack_balance):
+        # path which neither decoded nor split chunk starts at traced opcode or outside of ROM
+        created = self.stats.chunks_created
+        split = self.stats.chunks_split
+        super().follow_path(pc, bank, stack_balance)
+
+        if self.stats.chunks_created == created and self.stats.chunks_split == split:
+            self.stats.paths_rejected += 1
+
+    def update_queue_stats(self):
+        self.stats.queue_pushed = self.visit_queue.pushed
+        self.stats.queue_duplicates = self.visit_queue.duplicates
+        self.stats.queue_peak_depth = self.visit_queue.peak_depth
+
+    def trace_entries(self, entries):
+        with self.stats.phase('trace'):
+            super().trace_entries(entries)
+
+        self.update_queue_stats()
+
+    def iter_chunks(self, start_pc, start_bank):
+        for chunk in super().iter_chunks(start_pc, start_bank):
+            yield chunk
+
+        self.update_queue_stats()
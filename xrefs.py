@@ -0,0 +1,98 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from helpers import calculate_internal_address
+
+# cross reference kinds
+XREF_CALL = 'call'  # CALL, RST
+XREF_JUMP = 'jump'  # JR, JP, JP (HL) with resolved target
+XREF_READ = 'read'  # LDH A,(n)
+XREF_WRITE = 'write'  # LDH (n),A
+XREF_KINDS = (XREF_CALL, XREF_JUMP, XREF_READ, XREF_WRITE)
+
+
+class XrefIndex:
+    # reverse index of references, per kind sorted parallel arrays of targets and sources, code addresses are
+    # internal addresses (addresses >= 0x8000 are kept as they are), HW registers are 0xFF00 ~ 0xFFFF
+    def __init__(self):
+        self.pending = {kind: [] for kind in XREF_KINDS}  # kind -> list of (target << 32) | source
+        self.targets = {kind: array('I') for kind in XREF_KINDS}
+        self.sources = {kind: array('I') for kind in XREF_KINDS}
+        self.by_source = {}  # kind -> (sources, targets) sorted by source, built by get_targets
+
+    def add(self, kind, target, source):
+        self.pending[kind].append((target << 32) | source)
+
+    def add_code(self, kind, pc, bank, source):
+        # reference to code at pc in bank, negative pc is ignored
+        if pc < 0:
+            return
+
+        self.add(kind, calculate_internal_address(pc, bank) if pc < 0x8000 else pc, source)
+
+    def update(self, other):
+        # add all references of other index
+        for kind in XREF_KINDS:
+            self.pending[kind].extend(other.pending[kind])
+            self.pending[kind].extend((target << 32) | source
+                                      for target, source in zip(other.targets[kind], other.sources[kind]))
+
+    def add_register_accesses(self, chunk):
+        codes, args, addresses = chunk.codes, chunk.args, chunk.addresses
+
+        for index, opcode in enumerate(codes):
+            if opcode == 0xE0:
+                self.add(XREF_WRITE, 0xFF00 | args[index], addresses[index])
+
+            elif opcode == 0xF0:
+                self.add(XREF_READ, 0xFF00 | args[index], addresses[index])
+
+    def sort(self):
+        # move pending references to sorted arrays, duplicates are dropped
+        for kind, pending in self.pending.items():
+            if not pending:
+                continue
+
+            pairs = set(pending)
+            pairs.update((target << 32) | source for target, source in zip(self.targets[kind], self.sources[kind]))
+            pairs = sorted(pairs)
+
+            self.targets[kind] = array('I', (pair >> 32 for pair in pairs))
+            self.sources[kind] = array('I', (pair & 0xFFFFFFFF for pair in pairs))
+            self.by_source.pop(kind, None)
+            pending.clear()
+
+    def get_sources(self, kind, target):
+        self.sort()
+        targets = self.targets[kind]
+
+        return self.sources[kind][bisect_left(targets, target):bisect_right(targets, target)].tolist()
+
+    def get_targets(self, kind, source):
+        # targets referenced from source, order by source is built on first use
+        self.sort()
+
+        if kind not in self.by_source:
+            sources, targets = self.sources[kind], self.targets[kind]
+            order = sorted(range(len(sources)), key=sources.__getitem__)
+            self.by_source[kind] = (array('I', (sources[i] for i in order)), array('I', (targets[i] for i in order)))
+
+        sources, targets = self.by_source[kind]
+
+        return targets[bisect_left(sources, source):bisect_right(sources, source)].tolist()
+
+    def get_callers(self, address):
+        return self.get_sources(XREF_CALL, address)
+
+    def get_jumps(self, address):
+        return self.get_sources(XREF_JUMP, address)
+
+    def get_register_reads(self, register):
+        return self.get_sources(XREF_READ, 0xFF00 | register)
+
+    def get_register_writes(self, register):
+        return self.get_sources(XREF_WRITE, 0xFF00 | register)
+
+    def __len__(self):
+        self.sort()
+
+        return sum(len(targets) for targets in self.targets.values())